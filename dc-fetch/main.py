@@ -1,15 +1,23 @@
 # /// script
 # requires-python = ">=3.14"
-# dependencies = ["discum", "click"]
+# dependencies = ["discum", "click", "requests", "urllib3>=2", "brotli"]
 # ///
 
+import contextlib
 import json
 import os
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
 
 import click
 import discum
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from urllib3.util import make_headers
 
 
 def get_bot():
@@ -20,19 +28,206 @@ def get_bot():
     return discum.Client(token=token, log=False)
 
 
+TAIL_BLOCK = 1 << 16
+
+
+def repair_tail(path):
+    """Truncate a torn last line left by a crash mid-write."""
+    with open(path, 'r+b') as f:
+        end = pos = f.seek(0, os.SEEK_END)
+        while pos > 0:
+            step = min(TAIL_BLOCK, pos)
+            f.seek(pos - step)
+            i = f.read(step).rfind(b'\n')
+            if i >= 0:
+                pos = pos - step + i + 1
+                break
+            pos -= step
+        if pos < end:
+            click.echo(f'{path}: dropping {end - pos} byte torn tail', err=True)
+            f.truncate(pos)
+
+
 def last_msg_id(path):
+    """Id of the last complete line, reading blocks backwards from the end.
+
+    Messages are appended in id order, so resuming costs a block or two of
+    I/O however big the file is.
+    """
     if not os.path.exists(path):
         return None
-    last = None
-    with open(path) as f:
-        for line in f:
-            s = line.strip()
-            if s:
-                last = json.loads(s).get('id')
-    return last
+    repair_tail(path)
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        rest = b''
+        while pos > 0:
+            step = min(TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + rest).split(b'\n')
+            rest = lines.pop(0) if pos else b''  # may continue in the previous block
+            for line in reversed(lines):
+                with contextlib.suppress(json.JSONDecodeError, KeyError, TypeError):
+                    return json.loads(line)['id']
+    return None
+
+
+API = 'https://discord.com/api/v9'
+
+
+class Limiter:
+    """Discord's rate limits, as its response headers report them.
+
+    Requests are keyed by (route, major id). The first response on a route
+    names its X-RateLimit-Bucket; each (bucket, major id) then tracks
+    Remaining and Reset-After, and a request waits only when its own bucket
+    is spent. A 429 blocks its bucket for `retry_after` (everything, when
+    global). `rate` > 0 additionally caps requests/s across all threads.
+    """
+
+    def __init__(self, rate=0.0):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.cond = threading.Condition()
+        self.routes = {}  # route -> bucket hash
+        self.buckets = {}  # (bucket hash, major id) -> state
+        self.next = 0.0  # next free slot under `rate`, or the end of a global 429
+
+    def acquire(self, route, major):
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                b = self.buckets.get((self.routes.get(route), major))
+                if b and now >= b['reset']:  # window passed, assume a full one
+                    b['remaining'], b['reset'] = b['limit'], now + b['after']
+                wait = self.next - now
+                if b and b['remaining'] <= 0:
+                    wait = max(wait, b['reset'] - now)
+                if wait <= 0:
+                    break
+                self.cond.wait(wait)
+            if b:
+                b['remaining'] -= 1
+            self.next = max(self.next, now) + self.interval
+
+    def update(self, route, major, r):
+        h = r.headers
+        with self.cond:
+            now = time.monotonic()
+            if bucket := h.get('X-RateLimit-Bucket'):
+                self.routes[route] = bucket
+                with contextlib.suppress(KeyError, ValueError):
+                    after = float(h['X-RateLimit-Reset-After'])
+                    self.buckets[bucket, major] = {
+                        'limit': int(h['X-RateLimit-Limit']),
+                        'remaining': int(h['X-RateLimit-Remaining']),
+                        'reset': now + after,
+                        'after': after,
+                    }
+            if r.status_code == 429:
+                body = {}
+                with contextlib.suppress(ValueError):
+                    body = r.json()
+                retry = float(body.get('retry_after') or h.get('Retry-After') or 1)
+                b = self.buckets.get((self.routes.get(route), major))
+                if b and not (body.get('global') or h.get('X-RateLimit-Global')):
+                    b['remaining'], b['reset'] = 0, max(b['reset'], now + retry)
+                else:  # global, or a route we know nothing about yet
+                    self.next = max(self.next, now + retry)
+            self.cond.notify_all()
+
+
+TIMEOUT = (10, 30)  # connect, read seconds
+RETRIES = 5  # connection errors, timeouts and 5xx, per request
+BACKOFF = 0.5  # seconds, doubling per retry, plus up to as much jitter
+
+
+class Http:
+    """Pooled HTTP client shared by every worker.
+
+    Carries discum's auth and client headers, keeps up to `pool` keep-alive
+    connections to the API (one per worker, so none is dropped and
+    reopened), asks for gzip and brotli (and zstd where urllib3 has it), and
+    retries connection errors, timeouts and 5xx with jittered exponential
+    backoff. 429s are left to the Limiter. Latencies are recorded per
+    request for `summary`.
+    """
+
+    def __init__(self, bot, pool=1, retries=RETRIES):
+        self.s = requests.Session()
+        self.s.headers.update(bot.s.headers)
+        self.s.headers['Accept-Encoding'] = make_headers(accept_encoding=True)['accept-encoding']
+        self.s.proxies.update(bot.s.proxies)
+        retry = Retry(
+            total=retries,
+            backoff_factor=BACKOFF,
+            backoff_jitter=BACKOFF,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods={'GET'},
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool, max_retries=retry)
+        self.s.mount('https://', adapter)
+        self.s.mount('http://', adapter)
+        self.lock = threading.Lock()
+        self.times = []
+        self.retries = 0
+
+    def get(self, url, params=None):
+        t0 = time.perf_counter()
+        r = self.s.get(url, params=params, timeout=TIMEOUT)
+        dt = time.perf_counter() - t0
+        retried = len(r.raw.retries.history) if getattr(r.raw, 'retries', None) else 0
+        with self.lock:
+            self.times.append(dt)
+            self.retries += retried
+        return r
 
+    def summary(self):
+        with self.lock:
+            times = sorted(self.times)
+        if not times:
+            return 'http: no requests'
+        ms = {q: 1000 * times[min(len(times) - 1, int(q / 100 * len(times)))] for q in (50, 90, 99)}
+        return (
+            f'http: {len(times)} requests, {self.retries} retried, latency '
+            f'p50 {ms[50]:.0f} ms, p90 {ms[90]:.0f} ms, p99 {ms[99]:.0f} ms, '
+            f'max {1000 * times[-1]:.0f} ms'
+        )
 
-def dump_channel(bot, ch_id, ch_name, outdir, delay=0.5, limit=None):
+
+def api_get(http, limiter, route, major, path, params=None):
+    """GET `API/path` through the limiter, retrying 429s."""
+    while True:
+        limiter.acquire(route, major)
+        r = http.get(f'{API}/{path}', params=params)
+        limiter.update(route, major, r)
+        if r.status_code != 429:
+            return r
+        click.echo(f'{path}: rate limited, retrying', err=True)
+
+
+class Budget:
+    """Messages still wanted under --limit (None: no limit), shared by workers."""
+
+    def __init__(self, n=None):
+        self.n = n
+        self.lock = threading.Lock()
+
+    def left(self):
+        return self.n is None or self.n > 0
+
+    def spend(self, k):
+        with self.lock:
+            if self.n is not None:
+                self.n -= k
+
+    def stop(self):
+        with self.lock:
+            self.n = 0
+
+
+def dump_channel(http, limiter, ch_id, ch_name, outdir, budget=None):
+    budget = budget or Budget()
     os.makedirs(outdir, exist_ok=True)
     safe = ch_name.replace('/', '_').replace(' ', '_')
     path = os.path.join(outdir, f'{safe}_{ch_id}.jsonl')
@@ -41,46 +236,54 @@ def dump_channel(bot, ch_id, ch_name, outdir, delay=0.5, limit=None):
     if after != '0':
         click.echo(f'{ch_name}: resuming after {after}', err=True)
     with open(path, 'a') as f:
-        while limit is None or total < limit:
+        while budget.left():
             params = {'limit': 100, 'after': after}
-            url = f'https://discord.com/api/v9/channels/{ch_id}/messages'
-            msgs = bot.s.get(url, params=params).json()
-            if not isinstance(msgs, list) or not msgs:
+            r = api_get(http, limiter, 'messages', ch_id, f'channels/{ch_id}/messages', params)
+            if r.status_code != 200:
+                click.echo(f'{ch_name}: HTTP {r.status_code}: {r.text[:200]}', err=True)
+                break
+            msgs = r.json()
+            if not msgs:
                 break
             msgs.sort(key=lambda m: m['id'])
             f.writelines(json.dumps(m) + '\n' for m in msgs)
             f.flush()
             total += len(msgs)
+            budget.spend(len(msgs))
             after = msgs[-1]['id']
             click.echo(f'{ch_name}: {total} messages', err=True)
             if len(msgs) < 100:
                 break
-            time.sleep(delay)
     click.echo(f'{ch_name}: done ({total} new)', err=True)
     return total
 
 
-def fetch_threads(bot, guild_id, text_channels):
+def archived_threads(http, limiter, ch_id):
     threads = []
-    r = bot.s.get(f'https://discord.com/api/v9/guilds/{guild_id}/threads/active')
+    before = None
+    while True:
+        path = f'channels/{ch_id}/threads/archived/public'
+        r = api_get(http, limiter, 'archived', ch_id, path, {'before': before} if before else {})
+        if r.status_code != 200:
+            break
+        data = r.json()
+        batch = data.get('threads', [])
+        threads.extend(batch)
+        if not data.get('has_more') or not batch:
+            break
+        before = batch[-1].get('thread_metadata', {}).get('archive_timestamp')
+    return threads
+
+
+def fetch_threads(http, limiter, guild_id, text_channels, pool):
+    threads = []
+    r = api_get(http, limiter, 'active', guild_id, f'guilds/{guild_id}/threads/active')
     if r.status_code == 200:
         threads.extend(r.json().get('threads', []))
-    ch_ids = {str(c['id']) for c in text_channels}
-    for i, ch_id in enumerate(ch_ids):
-        click.echo(f'fetching archived threads {i + 1}/{len(ch_ids)}...', err=True)
-        before = None
-        while True:
-            url = f'https://discord.com/api/v9/channels/{ch_id}/threads/archived/public'
-            r = bot.s.get(url, params={'before': before} if before else {})
-            if r.status_code != 200:
-                break
-            data = r.json()
-            batch = data.get('threads', [])
-            threads.extend(batch)
-            if not data.get('has_more') or not batch:
-                break
-            before = batch[-1].get('thread_metadata', {}).get('archive_timestamp')
-            time.sleep(0.5)
+    ch_ids = sorted({str(c['id']) for c in text_channels})
+    click.echo(f'fetching archived threads of {len(ch_ids)} channels...', err=True)
+    for batch in pool.map(lambda ch_id: archived_threads(http, limiter, ch_id), ch_ids):
+        threads.extend(batch)
     seen = {}
     for t in threads:
         seen.setdefault(t['id'], t)
@@ -95,57 +298,68 @@ def main():
 @main.command()
 @click.argument('channel_id')
 @click.option('-o', '--output', default='./export/')
-@click.option('-r', '--rate', type=float, default=2.0)
+@click.option('-r', '--rate', type=float, default=0.0)
 @click.option('-l', '--limit', type=int, default=None)
 def channel(channel_id, output, rate, limit):
     """Dump a single channel."""
-    bot = get_bot()
-    dump_channel(bot, channel_id, channel_id, output, delay=1.0 / rate, limit=limit)
+    http = Http(get_bot())
+    dump_channel(http, Limiter(rate), channel_id, channel_id, output, Budget(limit))
+    click.echo(http.summary(), err=True)
 
 
 @main.command()
 @click.argument('guild_id')
 @click.option('-o', '--output', default='./export/')
 @click.option('--list', 'list_only', is_flag=True)
-@click.option('-r', '--rate', type=float, default=2.0)
+@click.option('-r', '--rate', type=float, default=0.0)
 @click.option('-l', '--limit', type=int, default=None)
-def guild(guild_id, output, list_only, rate, limit):
+@click.option('-j', '--jobs', type=int, default=1)
+def guild(guild_id, output, list_only, rate, limit, jobs):
     """Dump all text channels in a guild."""
-    bot = get_bot()
-    channels = bot.getGuildChannels(guild_id).json()
-    if not isinstance(channels, list):
+    jobs = max(1, jobs)
+    http = Http(get_bot(), pool=jobs)
+    limiter = Limiter(rate)
+    r = api_get(http, limiter, 'channels', guild_id, f'guilds/{guild_id}/channels')
+    channels = r.json()
+    if r.status_code != 200 or not isinstance(channels, list):
         raise click.ClickException(f'failed to get channels: {channels}')
     text = sorted(
         [c for c in channels if c.get('type') in (0, 5)],
         key=lambda c: c.get('position', 0),
     )
-    threads = fetch_threads(bot, guild_id, text)
-    if list_only:
-        for c in text:
-            kind = 'announcement' if c.get('type') == 5 else 'text'
-            click.echo(f'{c["id"]}\t{c["name"]}\t{kind}')
-        for t in threads:
-            click.echo(f'{t["id"]}\t{t["name"]}\tthread\tparent={t.get("parent_id")}')
-        return
-    delay = 1.0 / rate
-    gdir = os.path.join(output, str(guild_id))
-    remaining = limit
-    for c in text:
-        n = dump_channel(bot, c['id'], c['name'], gdir, delay=delay, limit=remaining)
-        if remaining is not None:
-            remaining -= n
-            if remaining <= 0:
-                break
-        time.sleep(delay)
-    if remaining is None or remaining > 0:
-        for t in threads:
-            name = f'{t.get("parent_id", "unknown")}_{t["name"]}'
-            n = dump_channel(bot, t['id'], name, gdir, delay=delay, limit=remaining)
-            if remaining is not None:
-                remaining -= n
-                if remaining <= 0:
-                    break
-            time.sleep(delay)
+    with ThreadPoolExecutor(jobs) as pool:
+        threads = fetch_threads(http, limiter, guild_id, text, pool)
+        if list_only:
+            for c in text:
+                kind = 'announcement' if c.get('type') == 5 else 'text'
+                click.echo(f'{c["id"]}\t{c["name"]}\t{kind}')
+            for t in threads:
+                click.echo(f'{t["id"]}\t{t["name"]}\tthread\tparent={t.get("parent_id")}')
+            return
+        gdir = os.path.join(output, str(guild_id))
+        budget = Budget(limit)
+        todo = [(c['id'], c['name']) for c in text]
+        todo += [(t['id'], f'{t.get("parent_id", "unknown")}_{t["name"]}') for t in threads]
+
+        def one(ch_id, name):
+            if budget.left():
+                dump_channel(http, limiter, ch_id, name, gdir, budget)
+
+        futures = {pool.submit(one, ch_id, name): name for ch_id, name in todo}
+        failed = 0
+        try:
+            for fut in as_completed(futures):
+                if e := fut.exception():
+                    click.echo(f'{futures[fut]}: failed: {e!r}', err=True)
+                    failed += 1
+        except KeyboardInterrupt:
+            budget.stop()  # running dumps end after their current page
+            pool.shutdown(cancel_futures=True)
+            raise
+        finally:
+            click.echo(http.summary(), err=True)
+        if failed:
+            raise click.ClickException(f'{failed} of {len(todo)} channels failed')
 
 
 if __name__ == '__main__':
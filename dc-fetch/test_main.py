@@ -0,0 +1,141 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import main
+import requests
+
+
+def write_msgs(path, ids):
+    with open(path, 'a') as f:
+        f.writelines(json.dumps({'id': str(i), 'content': 'x' * 50}) + '\n' for i in ids)
+
+
+def test_last_msg_id_missing_or_empty(tmp_path):
+    assert main.last_msg_id(tmp_path / 'none.jsonl') is None
+    (tmp_path / 'empty.jsonl').touch()
+    assert main.last_msg_id(tmp_path / 'empty.jsonl') is None
+
+
+def test_last_msg_id_reads_tail(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'TAIL_BLOCK', 16)  # lines span several blocks
+    p = tmp_path / 'c_1.jsonl'
+    write_msgs(p, range(100, 140))
+
+    assert main.last_msg_id(p) == '139'
+
+
+def test_last_msg_id_truncates_torn_line(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'TAIL_BLOCK', 16)
+    p = tmp_path / 'c_1.jsonl'
+    write_msgs(p, [1, 2])
+    with open(p, 'a') as f:
+        f.write('{"id": "3", "con')  # killed mid-write
+
+    assert main.last_msg_id(p) == '2'
+    assert p.read_text().endswith('"}\n')
+    write_msgs(p, [3])
+    assert [json.loads(line)['id'] for line in p.read_text().splitlines()] == ['1', '2', '3']
+
+
+class Response:
+    def __init__(self, status, body, headers=None):
+        self.status_code = status
+        self.body = body
+        self.headers = headers or {}
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+
+def bucket(remaining, reset_after=0.05):
+    return {
+        'X-RateLimit-Bucket': 'msgs',
+        'X-RateLimit-Limit': '5',
+        'X-RateLimit-Remaining': str(remaining),
+        'X-RateLimit-Reset-After': str(reset_after),
+    }
+
+
+SNOWFLAKE = 10**17
+
+
+class FakeHttp:
+    """Serves n messages of any channel, 100 per page; 429s the first request."""
+
+    def __init__(self, n):
+        self.n = SNOWFLAKE + n
+        self.requests = []
+
+    def get(self, url, params=None):
+        self.requests.append(url)
+        if len(self.requests) == 1:
+            return Response(429, {'retry_after': 0.01, 'global': False}, bucket(0))
+        after = max(int(params['after']), SNOWFLAKE)
+        page = [{'id': str(i)} for i in range(after + 1, min(after + 100, self.n) + 1)]
+        return Response(200, page[::-1], bucket(4))  # newest first, like Discord
+
+
+def test_limiter_waits_for_spent_bucket():
+    limiter = main.Limiter()
+    limiter.update('messages', '1', Response(200, [], bucket(0, 0.1)))
+    limiter.acquire('messages', '2')  # other channel: own bucket, no wait
+
+    t0 = main.time.monotonic()
+    limiter.acquire('messages', '1')
+    assert main.time.monotonic() - t0 >= 0.09
+
+
+def test_dump_retries_429_and_pages(tmp_path):
+    http = FakeHttp(250)
+
+    n = main.dump_channel(http, main.Limiter(), '1', 'general', tmp_path, main.Budget(150))
+
+    assert n == 200  # the budget is checked per page
+    assert len(http.requests) == 3
+    ids = [json.loads(line)['id'] for line in (tmp_path / 'general_1.jsonl').open()]
+    assert ids == [str(SNOWFLAKE + i) for i in range(1, 201)]
+
+
+class Flaky(BaseHTTPRequestHandler):
+    """503 twice, then a gzipped JSON page."""
+
+    failures = 2
+
+    def do_GET(self):  # noqa: N802
+        if Flaky.failures:
+            Flaky.failures -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = gzip.compress(json.dumps([{'id': '1'}]).encode())
+        self.send_response(200)
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_http_retries_5xx_and_decodes(monkeypatch):
+    monkeypatch.setattr(main, 'BACKOFF', 0.01)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Flaky)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    bot = type('Bot', (), {'s': requests.Session()})()
+    http = main.Http(bot, pool=2)
+    assert 'br' in http.s.headers['Accept-Encoding']  # brotli is a script dependency
+    try:
+        r = http.get(f'http://127.0.0.1:{server.server_port}/channels/1/messages')
+    finally:
+        server.shutdown()
+
+    assert r.status_code == 200
+    assert r.json() == [{'id': '1'}]
+    assert http.retries == 2
+    assert http.summary().startswith('http: 1 requests, 2 retried, latency p50 ')
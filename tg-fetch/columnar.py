@@ -0,0 +1,159 @@
+# /// script
+# requires-python = ">=3.14"
+# dependencies = ["pyarrow"]
+# ///
+"""Append tg-fetch JSONL archives to Parquet datasets.
+
+uv run columnar.py my-group.toml          # every group in the config
+uv run columnar.py tmp/tg_x.jl [...]      # or explicit archives
+
+`tmp/tg_<group>.jl` -> `tmp/tg_<group>.parquet/part-<first id>.parquet`,
+typed, zstd-compressed, in id (= date) order, so row-group statistics let
+readers skip by `date` or `id` range (not `sender_id`: every row group
+spans many senders). `_state.json` records how
+many archive bytes are converted; each run appends only the newer lines,
+as one new part once at least --min-rows are waiting.
+"""
+
+import argparse
+import io
+import json
+import sys
+import tomllib
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.json as pj
+import pyarrow.parquet as pq
+
+SCHEMA = pa.schema(
+    [
+        ('id', pa.int64()),
+        ('date', pa.timestamp('s', tz='UTC')),
+        ('sender_id', pa.int64()),
+        ('text', pa.string()),
+        ('reply_to_msg_id', pa.int64()),
+        ('fwd_from', pa.bool_()),
+        ('media', pa.string()),
+        ('media_file', pa.string()),
+    ]
+)
+CHUNK = 64 << 20  # JSONL bytes parsed at a time
+PART_ROWS = 1_000_000  # rows per part file
+ROW_GROUP = 128 * 1024  # rows per row group (the unit readers can skip)
+MIN_ROWS = 10_000
+
+
+def load_cfg(path: str) -> dict:
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+
+def cfg_groups(cfg: dict) -> list:
+    """`groups = [...]`, or the single `group` of older configs."""
+    return list(cfg.get('groups') or [cfg['group']])
+
+
+def dataset_path(jl: Path) -> Path:
+    return jl.with_suffix('.parquet')
+
+
+def load_state(d: Path) -> dict:
+    try:
+        return json.loads((d / '_state.json').read_text())
+    except FileNotFoundError:
+        return {'offset': 0, 'rows': 0}
+
+
+def save_state(d: Path, state: dict) -> None:
+    tmp = d / '_state.json.tmp'
+    tmp.write_text(json.dumps(state))
+    tmp.replace(d / '_state.json')
+
+
+def read_chunks(jl: Path, offset: int):
+    """Yield (table, end offset) for whole lines from `offset` on."""
+    opts = pj.ParseOptions(explicit_schema=SCHEMA, unexpected_field_behavior='ignore')
+    with open(jl, 'rb') as f:
+        f.seek(offset)
+        rest = b''
+        while chunk := f.read(CHUNK):
+            data = rest + chunk
+            cut = data.rfind(b'\n') + 1
+            data, rest = data[:cut], data[cut:]
+            offset += len(data)
+            if data:
+                yield pj.read_json(io.BytesIO(data), parse_options=opts), offset
+
+
+def write_part(d: Path, table: pa.Table) -> None:
+    name = f'part-{table["id"][0].as_py():012d}.parquet'
+    tmp = d / f'.{name}.tmp'
+    pq.write_table(
+        table,
+        tmp,
+        row_group_size=ROW_GROUP,
+        compression='zstd',
+        use_dictionary=['media'],
+        write_statistics=True,
+    )
+    tmp.replace(d / name)  # same first id after a crash: same name, overwritten
+
+
+def export(jl: Path, min_rows: int = MIN_ROWS) -> int:
+    """Convert archive lines not yet in the dataset; returns rows written.
+
+    Parts end on chunk boundaries, so the saved offset is always exact;
+    a part holds PART_ROWS rows plus at most one chunk's worth.
+    """
+    d = dataset_path(jl)
+    d.mkdir(exist_ok=True)
+    state = load_state(d)
+    if state['offset'] > jl.stat().st_size:
+        sys.exit(f'{jl} is shorter than {d} has converted; remove {d} to rebuild')
+    pending, rows, written = [], 0, 0
+    end = state['offset']
+
+    def flush(offset: int) -> None:
+        nonlocal pending, rows, written
+        write_part(d, pa.concat_tables(pending))
+        written += rows
+        pending, rows = [], 0
+        save_state(d, {'offset': offset, 'rows': state['rows'] + written})
+
+    for table, end in read_chunks(jl, state['offset']):
+        pending.append(table)
+        rows += table.num_rows
+        if rows >= PART_ROWS:
+            flush(end)
+    if rows and rows >= min_rows:
+        flush(end)
+    return written
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description='Append tg-fetch archives to Parquet datasets.')
+    ap.add_argument('inputs', nargs='+', help='config.toml or tg_<group>.jl files')
+    ap.add_argument(
+        '--min-rows',
+        type=int,
+        default=MIN_ROWS,
+        help=f'leave fewer new lines for the next run (default: {MIN_ROWS}; 0 flushes all)',
+    )
+    args = ap.parse_args()
+    archives = []
+    for arg in args.inputs:
+        if arg.endswith('.toml'):
+            archives += [Path(f'./tmp/tg_{g}.jl') for g in cfg_groups(load_cfg(arg))]
+        else:
+            archives.append(Path(arg))
+    for jl in archives:
+        if not jl.exists():
+            print(f'{jl}: no archive, skipping', file=sys.stderr)
+            continue
+        n = export(jl, args.min_rows)
+        print(f'{jl}: {n} rows -> {dataset_path(jl)}')
+
+
+if __name__ == '__main__':
+    main()
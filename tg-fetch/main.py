@@ -3,14 +3,30 @@
 # dependencies = ["telethon"]
 # ///
 
+import argparse
 import asyncio
 import contextlib
+import hashlib
 import json
+import os
 import sys
+import threading
+import time
 import tomllib
+from collections import Counter
+from datetime import UTC
+from datetime import datetime
 from pathlib import Path
+from typing import Self
 
 from telethon import TelegramClient
+from telethon import events
+from telethon import utils
+from telethon.errors import FloodWaitError
+from telethon.errors import RPCError
+from telethon.tl.types import InputPeerChannel
+from telethon.tl.types import InputPeerChat
+from telethon.tl.types import InputPeerUser
 from telethon.tl.types import Message
 
 
@@ -19,21 +35,117 @@ def load_cfg(path: str) -> dict:
         return tomllib.load(f)
 
 
+def cfg_groups(cfg: dict) -> list:
+    """`groups = [...]`, or the single `group` of older configs."""
+    return list(cfg.get('groups') or [cfg['group']])
+
+
+def session_path(cfg: dict) -> str:
+    # one session for all groups; named after the first so existing
+    # single-group sessions keep working without a new login
+    return f'./tmp/session_{cfg.get("session") or cfg_groups(cfg)[0]}'
+
+
 def out_path(group: str) -> Path:
     p = Path('./tmp')
     p.mkdir(exist_ok=True)
     return p / f'tg_{group}.jl'
 
 
-def last_id(p: Path) -> int:
+CKPT_EVERY = 200  # messages between checkpoint writes
+CKPT_SECS = 30  # ...or seconds, whichever comes first (matters when following)
+TAIL_BLOCK = 1 << 16
+
+
+def ckpt_path(p: Path) -> Path:
+    return p.with_name(f'{p.name}.ckpt')
+
+
+def save_ckpt(p: Path, last: int, count: int, offset: int) -> None:
+    """Atomically record resume state; `offset` is the archive size it covers."""
+    tmp = p.with_name(f'{p.name}.ckpt.tmp')
+    tmp.write_text(json.dumps({'last_id': last, 'count': count, 'offset': offset}))
+    tmp.replace(ckpt_path(p))
+
+
+def load_ckpt(p: Path) -> dict | None:
+    with contextlib.suppress(FileNotFoundError, json.JSONDecodeError):
+        ck = json.loads(ckpt_path(p).read_text())
+        if {'last_id', 'count', 'offset'} <= ck.keys():
+            return ck
+    return None
+
+
+def repair_tail(p: Path) -> None:
+    """Truncate a torn last line left by a crash mid-write."""
+    with open(p, 'r+b') as f:
+        end = f.seek(0, 2)
+        pos = end
+        while pos > 0:
+            step = min(TAIL_BLOCK, pos)
+            f.seek(pos - step)
+            block = f.read(step)
+            i = block.rfind(b'\n')
+            if i >= 0:
+                pos = pos - step + i + 1
+                break
+            pos -= step
+        if pos < end:
+            print(f'{p}: dropping {end - pos} byte torn tail')
+            f.truncate(pos)
+
+
+def tail_scan(p: Path) -> int:
+    """Id of the last parseable line, reading blocks backwards from the end."""
+    with open(p, 'rb') as f:
+        pos = f.seek(0, 2)
+        rest = b''
+        while pos > 0:
+            step = min(TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + rest).split(b'\n')
+            rest = lines.pop(0)  # may continue in the previous block
+            for line in reversed(lines):
+                with contextlib.suppress(json.JSONDecodeError, KeyError, TypeError):
+                    return json.loads(line)['id']
+        with contextlib.suppress(json.JSONDecodeError, KeyError, TypeError):
+            return json.loads(rest)['id']
+    return 0
+
+
+def count_lines(p: Path) -> int:
+    n = 0
+    with open(p, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            n += chunk.count(b'\n')
+    return n
+
+
+def resume_state(p: Path) -> tuple[int, int]:
+    """(last id, message count) of the archive.
+
+    Reads the checkpoint plus any lines written after it; without one, takes
+    the id from the last line (messages are appended in id order) and counts
+    newlines, so start-up never decodes the whole archive.
+    """
     if not p.exists():
-        return 0
-    last = 0
-    with open(p) as f:
+        return 0, 0
+    repair_tail(p)
+    size = p.stat().st_size
+    ck = load_ckpt(p)
+    if ck is None or ck['offset'] > size:
+        if size:
+            print(f'{ckpt_path(p)}: missing or stale, scanning tail of {p}')
+        return tail_scan(p), count_lines(p)
+    last, count = ck['last_id'], ck['count']
+    with open(p, 'rb') as f:
+        f.seek(ck['offset'])
         for line in f:
-            with contextlib.suppress(json.JSONDecodeError, KeyError):
-                last = max(last, json.loads(line.strip())['id'])
-    return last
+            with contextlib.suppress(json.JSONDecodeError, KeyError, TypeError):
+                last = max(last, json.loads(line)['id'])
+                count += 1
+    return last, count
 
 
 def msg_to_dict(m: Message) -> dict:
@@ -48,44 +160,859 @@ def msg_to_dict(m: Message) -> dict:
     }
 
 
-async def run(cfg: dict) -> None:
-    group = cfg['group']
-    p = out_path(group)
-    resume_id = last_id(p)
+# --- writing ---
+
+QUEUE_MAX = 2000  # records buffered ahead of the disk before fetchers block
+WRITE_BATCH = 500  # records per write call
+
+
+class JsonlWriter:
+    """Appends records to a JSONL file from a worker thread.
+
+    Fetchers `await put(record)` into a bounded queue (backpressure when the
+    disk falls behind); one task drains it in batches, serializing and
+    writing each batch via `asyncio.to_thread` so the event loop keeps
+    serving Telethon. Record values may be futures; they are awaited, in
+    order, before the record is written. With `ckpt`, the checkpoint is
+    rewritten every CKPT_EVERY records or CKPT_SECS. Leaving the `async with`
+    block, normally or through cancellation (Ctrl-C), writes everything
+    queued and the final checkpoint.
+    """
+
+    def __init__(self, p: Path, count: int = 0, last: int = 0, ckpt: bool = True) -> None:
+        self.p = p
+        self.count = count
+        self.last = last
+        self.ckpt = ckpt
+        self.queue = asyncio.Queue(QUEUE_MAX)
+        self.f = None
+        self.task = None
+        self.saved = time.monotonic()
+
+    async def __aenter__(self) -> Self:
+        self.f = await asyncio.to_thread(open, self.p, 'a')
+        self.task = asyncio.create_task(self._drain())
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if not self.task.done():
+            await self.queue.put(None)
+        try:
+            await self.task
+        finally:
+            if self.task.done():  # not mid-write after a second Ctrl-C
+                await asyncio.to_thread(self._close)
+
+    async def put(self, record: dict) -> None:
+        if self.task.done():
+            self.task.result()  # re-raise the write error
+            raise RuntimeError(f'{self.p}: writer closed')
+        await self.queue.put(record)
+
+    async def _drain(self) -> None:
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < WRITE_BATCH and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            end = None in batch
+            if end:
+                batch = batch[: batch.index(None)]
+            for r in batch:  # fields still being produced, e.g. media downloads
+                for k, v in r.items():
+                    if isinstance(v, asyncio.Future):
+                        r[k] = await v
+            if batch:
+                await asyncio.to_thread(self._write, batch)
+            if end:
+                return
+
+    def _write(self, batch: list[dict]) -> None:
+        self.f.write(''.join(json.dumps(r) + '\n' for r in batch))
+        self.f.flush()
+        before = self.count
+        self.count += len(batch)
+        self.last = batch[-1]['id']
+        due = self.count // CKPT_EVERY > before // CKPT_EVERY
+        if self.ckpt and (due or time.monotonic() - self.saved >= CKPT_SECS):
+            save_ckpt(self.p, self.last, self.count, self.p.stat().st_size)
+            self.saved = time.monotonic()
+
+    def _close(self) -> None:
+        self.f.flush()
+        if self.ckpt:
+            save_ckpt(self.p, self.last, self.count, self.p.stat().st_size)
+        self.f.close()
+
+
+# --- requests ---
+
+BATCH = 100  # messages per history request (server max)
+RATE = 3.0  # requests/s across all groups and parts
+PART_MIN = 1000  # don't split id ranges narrower than this per part
 
-    session = f'./tmp/session_{group}'
-    client = TelegramClient(session, int(cfg['api_id']), cfg['api_hash'])
 
+class FloodGate:
+    """Global request budget shared by every task.
+
+    Slots are handed out in arrival order and a task only queues again once
+    its request is done, so active groups and parts take turns round-robin.
+    A flood wait on any request pauses all of them.
+    """
+
+    def __init__(self, per_s: float) -> None:
+        self.interval = 1 / per_s if per_s > 0 else 0
+        self.next = 0.0
+
+    async def wait(self) -> None:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        at = max(self.next, now)
+        self.next = at + self.interval
+        await asyncio.sleep(at - now)
+
+    def hit(self, seconds: int) -> None:
+        self.next = max(self.next, asyncio.get_running_loop().time() + seconds)
+
+    async def call(self, fn, *args, **kwargs):
+        while True:
+            await self.wait()
+            try:
+                return await fn(*args, **kwargs)
+            except FloodWaitError as e:
+                print(f'flood wait {e.seconds}s, pausing all requests')
+                self.hit(e.seconds)
+
+
+async def history(client: TelegramClient, entity, gate: FloodGate, min_id: int, max_id: int = 0):
+    """Yield batches of messages with min_id < id < max_id, oldest first."""
+    while batch := await gate.call(
+        client.get_messages, entity, limit=BATCH, reverse=True, min_id=min_id, max_id=max_id
+    ):
+        yield batch
+        min_id = max(m.id for m in batch)
+
+
+class Progress:
+    def __init__(self, label: str, done: int, total: int | None, every: int = CKPT_EVERY) -> None:
+        self.label = label
+        self.done = done
+        self.total = total
+        self.every = every
+        self.fetched = 0
+        self.t0 = time.monotonic()
+
+    def add(self, n: int) -> None:
+        before = self.fetched
+        self.fetched += n
+        if self.fetched // self.every > before // self.every:
+            done = self.done + self.fetched
+            # without a head probe the total is unknown; the archive size isn't
+            of = f'{round(100 * done / self.total)}%' if self.total else f'{done} archived'
+            rate = self.fetched / max(time.monotonic() - self.t0, 1e-9)
+            print(f'{self.label}: fetched {self.fetched} ({of}, {rate:.0f} msg/s)')
+
+
+class CountingClient(TelegramClient):
+    """TelegramClient that tallies network round-trips by request type, for --stats."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.calls = Counter()
+        self.marked = Counter()
+        self.t = time.monotonic()
+
+    async def connect(self) -> None:
+        self.calls['connect'] += 1
+        await super().connect()
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        for r in request if utils.is_list_like(request) else (request,):
+            self.calls[type(r).__name__] += 1
+        return await super().__call__(request, ordered, flood_sleep_threshold)
+
+    def lap(self, label: str) -> str:
+        """Calls since the previous lap, e.g. `start-up: 2 calls in 0.4s (connect 1, ...)`."""
+        now, calls = time.monotonic(), self.calls.copy()
+        diff = calls - self.marked
+        detail = ', '.join(f'{k} {v}' for k, v in diff.most_common()) or 'none'
+        line = f'{label}: {diff.total()} calls in {now - self.t:.1f}s ({detail})'
+        self.marked, self.t = calls, now
+        return line
+
+
+async def login(client: TelegramClient, cfg: dict) -> None:
+    # not `async with client`: that runs start() again, one more get_me
     if 'bot_token' in cfg:
         await client.start(bot_token=cfg['bot_token'])
     else:
         await client.start(phone=lambda: cfg['phone'])
 
-    async with client:
-        entity = await client.get_entity(group)
-        total = (await client.get_messages(entity, limit=1)).total
-        print(f'group total={total}, resuming after id={resume_id}')
 
-        fetched = 0
-        with open(p, 'a') as f:  # noqa: ASYNC230
-            async for m in client.iter_messages(entity, reverse=True, min_id=resume_id):
-                if not isinstance(m, Message):
-                    continue
-                f.write(json.dumps(msg_to_dict(m)) + '\n')
-                fetched += 1
-                if fetched % 200 == 0:
-                    done = resume_id + fetched
-                    pct = round(100 * done / total) if total else '?'
-                    print(f'fetched {fetched} ({pct}%)')
+# --- entities ---
+
+ENTITIES = Path('./tmp/entities.json')
+ENTITY_TTL = 24 * 3600  # seconds a resolved group is trusted
+PEERS = {'channel': InputPeerChannel, 'chat': InputPeerChat, 'user': InputPeerUser}
+
+
+class EntityCache:
+    """Resolved groups, kept on disk so start-up skips `get_entity`.
+
+    Stores what an input peer needs (type, id, access hash) plus the title,
+    keyed by the group as configured. Usernames get reassigned, so entries
+    expire after `ttl`; `drop` forgets one whose requests failed, and the
+    next run resolves it again.
+    """
+
+    def __init__(self, path: Path = ENTITIES, ttl: float = ENTITY_TTL) -> None:
+        self.path = path
+        self.ttl = ttl
+        try:
+            self.entries = json.loads(path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    async def resolve(self, client: TelegramClient, gate: FloodGate, group):
+        e = self.entries.get(str(group))
+        if e and time.time() - e['ts'] < self.ttl:
+            args = (e['id'], e['access_hash']) if e['type'] != 'chat' else (e['id'],)
+            return PEERS[e['type']](*args)
+        entity = await gate.call(client.get_entity, group)
+        peer = utils.get_input_peer(entity)
+        kind = next(k for k, cls in PEERS.items() if isinstance(peer, cls))
+        self.entries[str(group)] = {
+            'type': kind,
+            'id': utils.get_peer_id(peer, add_mark=False),
+            'access_hash': getattr(peer, 'access_hash', None),
+            'title': utils.get_display_name(entity),
+            'ts': time.time(),
+        }
+        self.save()
+        return peer
+
+    def drop(self, group) -> None:
+        if self.entries.pop(str(group), None):
+            self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(exist_ok=True)
+        tmp = self.path.with_name(f'{self.path.name}.tmp')
+        tmp.write_text(json.dumps(self.entries, indent=1))
+        tmp.replace(self.path)
+
+
+# --- media ---
+
+MEDIA_DIR = Path('./tmp/media')
+MEDIA_KINDS = ('photo', 'video', 'gif', 'sticker', 'voice', 'audio', 'document')
+MEDIA_RETRIES = 3
+
+
+def media_kind(m: Message) -> str | None:
+    """Downloadable media class of a message, None for webpages, polls, etc."""
+    for kind in MEDIA_KINDS[:-1]:
+        if getattr(m, kind, None):
+            return kind
+    return 'document' if m.document else None
+
+
+def media_file_id(m: Message) -> int:
+    return (m.photo or m.document).id
+
+
+class MediaStore:
+    """Content-addressed media downloads, shared by every group in a run.
+
+    Files land in MEDIA_DIR/<sha256[:2]>/<sha256><ext>, so a file forwarded
+    into many chats is stored once; `index.jl` maps Telegram file ids to
+    hashes, so a known file is not even downloaded again. `submit` returns a
+    future of the path relative to MEDIA_DIR (None if skipped or failed);
+    `workers` tasks download concurrently through the shared FloodGate,
+    retrying with backoff.
+    """
+
+    def __init__(
+        self,
+        client: TelegramClient,
+        gate: FloodGate,
+        kinds: tuple = ('photo',),
+        max_bytes: int = 20 << 20,
+        quota: int = 0,
+        workers: int = 4,
+        root: Path = MEDIA_DIR,
+    ) -> None:
+        self.client = client
+        self.gate = gate
+        self.kinds = kinds
+        self.max_bytes = max_bytes
+        self.quota = quota
+        self.nworkers = workers
+        self.root = root
+        self.index = {}
+        self.inflight = {}
+        self.stored = 0
+        self.queue = asyncio.Queue()
+        self.lock = threading.Lock()
+        self.workers = []
+
+    async def __aenter__(self) -> Self:
+        await asyncio.to_thread(self._load)
+        self.workers = [asyncio.create_task(self._work()) for _ in range(self.nworkers)]
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        for t in self.workers:
+            t.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    def submit(self, m: Message) -> asyncio.Future | None:
+        kind = media_kind(m)
+        if kind not in self.kinds:
+            return None
+        size = m.file.size or 0
+        if size > self.max_bytes or (self.quota and self.stored + size > self.quota):
+            return None
+        fid = media_file_id(m)
+        loop = asyncio.get_running_loop()
+        if fid in self.index:
+            fut = loop.create_future()
+            fut.set_result(self.index[fid])
+            return fut
+        if fid not in self.inflight:
+            self.inflight[fid] = loop.create_future()
+            self.stored += size  # reserve against the quota
+            self.queue.put_nowait((m, fid))
+        return self.inflight[fid]
+
+    async def _work(self) -> None:
+        while True:
+            m, fid = await self.queue.get()
+            fut = self.inflight[fid]  # stays claimed until `index` has it
+            try:
+                fut.set_result(await self._fetch(m, fid))
+            except Exception as e:
+                print(f'media {fid} (msg {m.id}): giving up: {e!r}', file=sys.stderr)
+                self.stored -= m.file.size or 0  # release the reservation
+                fut.set_result(None)
+            finally:
+                del self.inflight[fid]
+
+    async def _fetch(self, m: Message, fid: int) -> str:
+        for attempt in range(MEDIA_RETRIES - 1):
+            try:
+                return await self._download(m, fid, attempt)
+            except (OSError, RPCError) as e:
+                print(f'media {fid}: {e!r}, retrying')
+                await asyncio.sleep(2**attempt)
+        return await self._download(m, fid, MEDIA_RETRIES - 1)
+
+    async def _download(self, m: Message, fid: int, attempt: int) -> str:
+        # never shared: not by retries, nor by another run on the same store
+        tmp = self.root / '.incoming' / f'{fid}-{os.getpid()}-{attempt}{m.file.ext or ""}'
+        try:
+            await self.gate.call(self.client.download_media, m, file=str(tmp))
+            return await asyncio.to_thread(self._store, tmp, fid)
+        except (OSError, RPCError):
+            tmp.unlink(missing_ok=True)
+            raise
+
+    def _load(self) -> None:
+        (self.root / '.incoming').mkdir(parents=True, exist_ok=True)
+        with contextlib.suppress(FileNotFoundError), open(self.root / 'index.jl') as f:
+            for line in f:
+                with contextlib.suppress(json.JSONDecodeError, KeyError):
+                    e = json.loads(line)
+                    self.index[e['file_id']] = e['path']
+                    self.stored += e['size']
+
+    def _store(self, tmp: Path, fid: int) -> str:
+        with open(tmp, 'rb') as f:
+            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+        rel = f'{digest[:2]}/{digest}{tmp.suffix}'
+        dst = self.root / rel
+        size = tmp.stat().st_size
+        if dst.exists():
+            tmp.unlink()
+        else:
+            dst.parent.mkdir(exist_ok=True)
+            tmp.replace(dst)
+        entry = {'file_id': fid, 'path': rel, 'size': size}
+        with self.lock, open(self.root / 'index.jl', 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.index[fid] = rel
+        return rel
+
+
+def to_record(m: Message, media: MediaStore | None = None) -> dict:
+    r = msg_to_dict(m)
+    if media:
+        r['media_file'] = media.submit(m)
+    return r
+
+
+# --- partitioned backfill ---
+
+
+def plan_path(p: Path) -> Path:
+    return p.with_name(f'{p.name}.parts.json')
+
+
+def part_path(p: Path, i: int) -> Path:
+    return p.with_name(f'{p.name}.part{i:03d}')
+
+
+def save_plan(p: Path, plan: dict) -> None:
+    tmp = p.with_name(f'{p.name}.parts.tmp')
+    tmp.write_text(json.dumps(plan))
+    tmp.replace(plan_path(p))
+
+
+def make_plan(resume_id: int, latest: int, k: int) -> dict:
+    """Split ids (resume_id, latest] into `k` contiguous (lo, hi] ranges."""
+    k = max(1, min(k, (latest - resume_id) // PART_MIN))
+    step = -(-(latest - resume_id) // k)
+    parts = [
+        {'lo': lo, 'hi': min(lo + step, latest), 'done': False}
+        for lo in range(resume_id, latest, step)
+    ]
+    return {'resume_id': resume_id, 'latest': latest, 'parts': parts}
+
+
+async def fetch_part(
+    client: TelegramClient,
+    entity,
+    p: Path,
+    plan: dict,
+    i: int,
+    gate: FloodGate,
+    progress: Progress,
+    media: MediaStore | None = None,
+) -> None:
+    """Fetch one (lo, hi] range oldest-first into its own segment file."""
+    part = plan['parts'][i]
+    seg = part_path(p, i)
+    cur = part['lo']
+    if seg.exists():
+        repair_tail(seg)
+        cur = max(cur, tail_scan(seg))
+    async with JsonlWriter(seg, ckpt=False) as w:
+        async for batch in history(client, entity, gate, cur, part['hi'] + 1):
+            msgs = [m for m in batch if isinstance(m, Message)]
+            for m in msgs:
+                await w.put(to_record(m, media))
+            progress.add(len(msgs))
+    part['done'] = True
+    save_plan(p, plan)
+
+
+def merge_parts(p: Path, plan: dict) -> tuple[int, int]:
+    """Append finished segments to the archive in id order, then remove them.
+
+    Lines with ids at or below the archive's last id are skipped, so a merge
+    interrupted half-way can simply be run again.
+    """
+    last, count = resume_state(p)
+    with open(p, 'a') as out:
+        for i in range(len(plan['parts'])):
+            seg = part_path(p, i)
+            if not seg.exists():
+                continue
+            with open(seg) as f:
+                for line in f:
+                    try:
+                        id_ = json.loads(line)['id']
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        continue
+                    if id_ > last:
+                        out.write(line)
+                        last = id_
+                        count += 1
+            out.flush()
+            os.fsync(out.fileno())
+            save_ckpt(p, last, count, p.stat().st_size)
+            seg.unlink()
+    plan_path(p).unlink()
+    return last, count
+
+
+async def backfill(
+    client: TelegramClient,
+    entity,
+    p: Path,
+    resume_id: int,
+    latest: int,
+    k: int,
+    gate: FloodGate,
+    progress: Progress,
+    media: MediaStore | None = None,
+) -> tuple[int, int]:
+    """Download (resume_id, latest] as `k` concurrent id ranges, then merge.
+
+    The plan and per-part segments survive an interrupt; the next run picks
+    them up (whatever -j it is given) and resumes each part from its tail.
+    """
+    try:
+        plan = json.loads(plan_path(p).read_text())
+        print(f'{progress.label}: resuming backfill of ids {plan["resume_id"]}..{plan["latest"]}')
+    except FileNotFoundError:
+        plan = make_plan(resume_id, latest, k)
+        save_plan(p, plan)
+    todo = [i for i, part in enumerate(plan['parts']) if not part['done']]
+    print(f'{progress.label}: backfill in {len(plan["parts"])} parts, {len(todo)} to fetch')
+    async with asyncio.TaskGroup() as tg:
+        for i in todo:
+            tg.create_task(fetch_part(client, entity, p, plan, i, gate, progress, media))
+    return await asyncio.to_thread(merge_parts, p, plan)
+
+
+# --- groups ---
+
+
+async def archive(
+    client: TelegramClient,
+    group,
+    gate: FloodGate,
+    entity,
+    parts: int = 1,
+    media: MediaStore | None = None,
+) -> int:
+    """Bring `tg_<group>.jl` up to date; returns the number of new messages.
+
+    The newest message is only probed when -j needs it to plan a backfill;
+    otherwise a group with nothing new costs its one empty history page.
+    """
+    p = out_path(group)
+    resume_id, count = resume_state(p)
+    progress = Progress(group, count, None)
+    latest = 0
+    if parts > 1 and not plan_path(p).exists():
+        head = await gate.call(client.get_messages, entity, limit=1)
+        latest, progress.total = (head[0].id if head else 0), head.total
+    if plan_path(p).exists() or latest - resume_id >= 2 * PART_MIN:
+        print(f'{group}: total={progress.total}, {count} on disk, resuming after id={resume_id}')
+        resume_id, count = await backfill(
+            client, entity, p, resume_id, latest, parts, gate, progress, media
+        )
+        progress.done = count - progress.fetched
+
+    # the tail: messages after the backfill's `latest`, or the whole run
+    # when not partitioned
+    async with JsonlWriter(p, count, resume_id) as w:
+        async for batch in history(client, entity, gate, resume_id):
+            msgs = [m for m in batch if isinstance(m, Message)]
+            for m in msgs:
+                await w.put(to_record(m, media))
+            progress.add(len(msgs))
+
+    if progress.fetched:
+        print(f'{group}: {progress.fetched} new messages -> {p} ({w.count} total)')
+    return progress.fetched
+
+
+# --- follow ---
+
+FOLLOW_CHECK = 60.0  # seconds between safety catch-ups while following
+RECONNECT_BACKOFF = 1.0  # first retry delay after a failed reconnect, doubling to a minute
+
+
+def events_path(p: Path) -> Path:
+    return p.with_name(f'{p.name.removesuffix(".jl")}.events.jl')
+
+
+class Follower:
+    """Keeps one group's archive open and appends messages as they arrive.
+
+    A NewMessage event only wakes the group; the messages themselves come
+    from a `min_id=<last>` catch-up, so whatever was missed while the
+    connection was down is fetched in order along with the new message, and
+    a burst of events costs one request. Edits and deletions go to
+    `tg_<group>.events.jl` as `edit` / `delete` records.
+    """
+
+    def __init__(
+        self,
+        client: TelegramClient,
+        group,
+        entity,
+        gate: FloodGate,
+        media: MediaStore | None = None,
+    ) -> None:
+        self.client = client
+        self.group = group
+        self.entity = entity
+        self.gate = gate
+        self.media = media
+        self.p = out_path(group)
+        self.wake = asyncio.Event()
+        self.stack = contextlib.AsyncExitStack()
+        self.w = None
+        self.events = None
+        self.last = 0
+
+    async def __aenter__(self) -> Self:
+        self.last, count = resume_state(self.p)
+        self.w = await self.stack.enter_async_context(JsonlWriter(self.p, count, self.last))
+        self.events = await self.stack.enter_async_context(
+            JsonlWriter(events_path(self.p), ckpt=False)
+        )
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stack.aclose()
+
+    async def run(self) -> None:
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            try:
+                await self.catch_up()
+            except Exception as e:  # e.g. offline: the next wake tries again
+                print(f'{self.group}: catch-up failed: {e!r}', file=sys.stderr)
+
+    async def catch_up(self) -> int:
+        n = 0
+        async for batch in history(self.client, self.entity, self.gate, self.last):
+            for m in batch:
+                if isinstance(m, Message):
+                    await self.w.put(to_record(m, self.media))
+                    n += 1
+            self.last = max(m.id for m in batch)
+        if n:
+            print(f'{self.group}: +{n} (last id {self.last})')
+        return n
+
+    async def edited(self, m: Message) -> None:
+        edit = m.edit_date.isoformat() if m.edit_date else None
+        await self.events.put({'type': 'edit', **msg_to_dict(m), 'edit_date': edit})
+
+    async def deleted(self, ids: list[int]) -> None:
+        ts = datetime.now(UTC).isoformat()
+        for id_ in ids:
+            await self.events.put({'type': 'delete', 'id': id_, 'date': ts})
+
+
+async def follow_groups(
+    client: TelegramClient,
+    groups: list,
+    peers: dict,
+    gate: FloodGate,
+    media: MediaStore | None = None,
+    edits: bool = False,
+    check: float = FOLLOW_CHECK,
+) -> None:
+    """Tail every group until interrupted, reconnecting as needed."""
+    followers = {}
+    async with contextlib.AsyncExitStack() as stack, asyncio.TaskGroup() as tg:
+        for group in groups:
+            if group not in peers:
+                print(f'{group}: not resolved, not following', file=sys.stderr)
+                continue
+            f = await stack.enter_async_context(Follower(client, group, peers[group], gate, media))
+            followers[utils.get_peer_id(peers[group])] = f
+            tg.create_task(f.run())
+        chats = [f.entity for f in followers.values()]
+
+        async def on_new(ev) -> None:
+            followers[ev.chat_id].wake.set()
+
+        async def on_edit(ev) -> None:
+            await followers[ev.chat_id].edited(ev.message)
+
+        async def on_delete(ev) -> None:
+            if ev.chat_id in followers:  # None outside channels: can't attribute
+                await followers[ev.chat_id].deleted(ev.deleted_ids)
+
+        client.add_event_handler(on_new, events.NewMessage(chats=chats))
+        if edits:
+            client.add_event_handler(on_edit, events.MessageEdited(chats=chats))
+            client.add_event_handler(on_delete, events.MessageDeleted())
+        print(f'following {len(followers)} groups')
+        while True:
+            for f in followers.values():
+                f.wake.set()  # periodic and post-reconnect gap check
+            # resolves with ConnectionError when Telethon's own retries give up
+            with contextlib.suppress(TimeoutError, ConnectionError):
+                await asyncio.wait_for(asyncio.shield(client.disconnected), check)
+            if not client.is_connected():
+                await reconnect(client)
+
+
+async def reconnect(client: TelegramClient) -> None:
+    delay = RECONNECT_BACKOFF
+    while True:
+        print('disconnected, reconnecting')
+        try:
+            await client.connect()
+        except OSError as e:  # ConnectionError included
+            print(f'reconnect failed: {e!r}, retrying in {delay:.0f}s', file=sys.stderr)
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, 60)
+        else:
+            return
+
+
+async def run(
+    cfg: dict,
+    parts: int = 1,
+    rate: float = RATE,
+    concurrency: int = 4,
+    poll: float = 0,
+    media: dict | None = None,
+    follow: bool = False,
+    edits: bool = False,
+    entity_ttl: float = ENTITY_TTL,
+    stats: bool = False,
+) -> None:
+    """Archive every group; `media` holds MediaStore options, None to skip media."""
+    groups = cfg_groups(cfg)
+    client = CountingClient(session_path(cfg), int(cfg['api_id']), cfg['api_hash'])
+    await login(client, cfg)
+
+    client.flood_sleep_threshold = 0  # every flood wait goes through the shared gate
+    gate = FloodGate(rate)
+    slots = asyncio.Semaphore(concurrency)
+    cache = EntityCache(ttl=entity_ttl)
+    peers = {}
+
+    store = MediaStore(client, gate, **media) if media is not None else None
+
+    async def resolve(group) -> None:
+        try:
+            peers[group] = await cache.resolve(client, gate, group)
+        except (ValueError, RPCError) as e:
+            print(f'{group}: cannot resolve: {e!r}', file=sys.stderr)
+
+    async def one(group) -> int:
+        async with slots:
+            if group not in peers:
+                return 0
+            try:
+                return await archive(client, group, gate, peers[group], parts, store)
+            except Exception as e:
+                print(f'{group}: failed: {e!r}', file=sys.stderr)
+                cache.drop(group)  # maybe a stale access hash; resolve afresh next time
+                peers.pop(group)
+                return 0
 
-    print(f'done — {fetched} new messages -> {p}')
+    try:
+        async with store or contextlib.nullcontext():
+            await asyncio.gather(*(resolve(g) for g in groups))
+            if stats:
+                print(client.lap('start-up'))
+            while True:
+                new = await asyncio.gather(*(one(g) for g in groups))
+                print(f'done — {sum(new)} new messages in {len(groups)} groups')
+                if stats:
+                    print(client.lap('fetch'))
+                if follow:
+                    await follow_groups(
+                        client, groups, peers, gate, store, edits, poll or FOLLOW_CHECK
+                    )
+                if not poll:
+                    return
+                await asyncio.sleep(poll)
+                await asyncio.gather(*(resolve(g) for g in groups if g not in peers))
+    finally:
+        await client.disconnect()
 
 
 def main() -> None:
-    if len(sys.argv) < 2:
-        print('usage: uv run main.py <config.toml>', file=sys.stderr)
-        sys.exit(1)
-    asyncio.run(run(load_cfg(sys.argv[1])))
+    ap = argparse.ArgumentParser(description='Archive Telegram groups to JSONL.')
+    ap.add_argument('config', help='config.toml')
+    ap.add_argument(
+        '-j',
+        '--parts',
+        type=int,
+        default=1,
+        help='backfill history as N concurrent id ranges (default: 1, sequential)',
+    )
+    ap.add_argument(
+        '-c',
+        '--concurrency',
+        type=int,
+        default=4,
+        help='groups archived at the same time (default: 4)',
+    )
+    ap.add_argument(
+        '--rate',
+        type=float,
+        default=RATE,
+        help=f'requests/s across all groups and parts (default: {RATE})',
+    )
+    ap.add_argument(
+        '--poll',
+        type=float,
+        default=0,
+        metavar='SECONDS',
+        help='stay running and re-check every group at this interval',
+    )
+    ap.add_argument(
+        '--follow',
+        action='store_true',
+        help='after catching up, stay connected and append new messages live',
+    )
+    ap.add_argument(
+        '--edits',
+        action='store_true',
+        help='with --follow, log edits and deletions to tg_<group>.events.jl',
+    )
+    ap.add_argument(
+        '--media', action='store_true', help=f'download media into {MEDIA_DIR}, deduped by hash'
+    )
+    ap.add_argument(
+        '--media-types',
+        default='photo',
+        help=f'comma-separated kinds to download, from {",".join(MEDIA_KINDS)} (default: photo)',
+    )
+    ap.add_argument(
+        '--media-max-mb', type=float, default=20, help='skip larger files (default: 20)'
+    )
+    ap.add_argument(
+        '--media-quota-gb',
+        type=float,
+        default=0,
+        help='stop downloading once the media store reaches this size (default: no limit)',
+    )
+    ap.add_argument(
+        '--media-workers', type=int, default=4, help='concurrent downloads (default: 4)'
+    )
+    ap.add_argument(
+        '--entity-ttl',
+        type=float,
+        default=ENTITY_TTL / 3600,
+        metavar='HOURS',
+        help=f'reuse groups resolved within this long from {ENTITIES} (default: 24; 0 = never)',
+    )
+    ap.add_argument(
+        '--stats', action='store_true', help='print network calls made during start-up and fetch'
+    )
+    args = ap.parse_args()
+    cfg = load_cfg(args.config)
+    kinds = tuple(k.strip() for k in args.media_types.split(','))
+    if unknown := set(kinds) - set(MEDIA_KINDS):
+        ap.error(f'unknown media types: {", ".join(sorted(unknown))}')
+    media = None
+    if args.media:
+        media = {
+            'kinds': kinds,
+            'max_bytes': int(args.media_max_mb * (1 << 20)),
+            'quota': int(args.media_quota_gb * (1 << 30)),
+            'workers': args.media_workers,
+        }
+    asyncio.run(
+        run(
+            cfg,
+            args.parts,
+            args.rate,
+            args.concurrency,
+            args.poll,
+            media,
+            args.follow,
+            args.edits,
+            args.entity_ttl * 3600,
+            args.stats,
+        )
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+import json
+
+import columnar
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+def write_archive(path, ids):
+    with open(path, 'a') as f:
+        for i in ids:
+            r = {
+                'id': i,
+                'date': f'2026-01-{1 + i % 28:02d}T12:00:00+00:00',
+                'sender_id': i % 3 or None,
+                'text': f'm{i}',
+                'reply_to_msg_id': None,
+                'fwd_from': False,
+                'media': 'MessageMediaPhoto' if i % 2 else None,
+            }
+            f.write(json.dumps(r) + '\n')
+
+
+def test_export_appends_only_new_lines(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, 'CHUNK', 256)  # many chunks per run
+    jl = tmp_path / 'tg_x.jl'
+    write_archive(jl, range(1, 51))
+
+    assert columnar.export(jl, min_rows=0) == 50
+    write_archive(jl, range(51, 61))
+    with open(jl, 'a') as f:
+        f.write('{"id": 61, "te')  # torn line, left for the next run
+    assert columnar.export(jl, min_rows=0) == 10
+
+    d = columnar.dataset_path(jl)
+    assert sorted(p.name for p in d.glob('*.parquet')) == [
+        'part-000000000001.parquet',
+        'part-000000000051.parquet',
+    ]
+    table = ds.dataset(d).to_table()
+    assert table['id'].to_pylist() == list(range(1, 61))
+    assert table.schema.field('date').type.tz == 'UTC'
+    assert columnar.load_state(d)['rows'] == 60
+
+
+def test_export_holds_back_small_batches(tmp_path):
+    jl = tmp_path / 'tg_x.jl'
+    write_archive(jl, range(1, 6))
+
+    assert columnar.export(jl, min_rows=10) == 0
+    write_archive(jl, range(6, 11))
+    assert columnar.export(jl, min_rows=10) == 10
+
+
+def test_part_stats_allow_pushdown(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, 'ROW_GROUP', 10)
+    jl = tmp_path / 'tg_x.jl'
+    write_archive(jl, range(1, 101))
+    columnar.export(jl, min_rows=0)
+
+    meta = pq.ParquetFile(next(columnar.dataset_path(jl).glob('*.parquet'))).metadata
+    assert meta.num_row_groups == 10
+    stats = meta.row_group(3).column(0).statistics
+    assert (stats.min, stats.max) == (31, 40)
@@ -0,0 +1,371 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+from datetime import UTC
+from datetime import datetime
+from pathlib import Path
+
+import main
+from telethon.errors import FloodWaitError
+from telethon.helpers import TotalList
+from telethon.tl.types import Channel
+from telethon.tl.types import ChatPhotoEmpty
+from telethon.tl.types import InputPeerChannel
+from telethon.tl.types import Message
+from telethon.tl.types import MessageMediaPhoto
+from telethon.tl.types import PeerChannel
+from telethon.tl.types import Photo
+from telethon.tl.types import PhotoSize
+
+
+def write_archive(path, ids):
+    with open(path, 'a') as f:
+        f.writelines(json.dumps({'id': i, 'text': f'm{i}'}) + '\n' for i in ids)
+
+
+def test_resume_empty(tmp_path):
+    assert main.resume_state(tmp_path / 'tg_x.jl') == (0, 0)
+
+
+def test_resume_from_checkpoint_and_newer_lines(tmp_path):
+    p = tmp_path / 'tg_x.jl'
+    write_archive(p, [1, 2, 3])
+    main.save_ckpt(p, 3, 3, p.stat().st_size)
+    write_archive(p, [4, 5])  # written after the last checkpoint
+
+    assert main.resume_state(p) == (5, 5)
+
+
+def test_resume_without_checkpoint_scans_tail(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'TAIL_BLOCK', 8)  # lines span several blocks
+    p = tmp_path / 'tg_x.jl'
+    write_archive(p, range(1, 40))
+    with open(p, 'a') as f:
+        f.write('{"id": 40, "te')  # torn by a crash
+
+    assert main.resume_state(p) == (39, 39)
+    assert p.read_text().endswith('"m39"}\n')
+
+
+def test_resume_ignores_checkpoint_past_end(tmp_path):
+    p = tmp_path / 'tg_x.jl'
+    write_archive(p, [7, 8])
+    main.save_ckpt(p, 99, 50, 10_000)
+
+    assert main.resume_state(p) == (8, 2)
+
+
+DATE = datetime(2026, 1, 1, tzinfo=UTC)
+
+
+def msg(id_, media=None):
+    return Message(id=id_, peer_id=PeerChannel(1), date=DATE, media=media)
+
+
+def photo(file_id, size=3):
+    sizes = [PhotoSize(type='x', w=1, h=1, size=size)]
+    return MessageMediaPhoto(
+        photo=Photo(id=file_id, access_hash=0, file_reference=b'', date=DATE, sizes=sizes, dc_id=2)
+    )
+
+
+class FakeClient:
+    """Serves ids 1..latest; the first history request hits a flood wait."""
+
+    def __init__(self, latest, flood=True):
+        self.ids = list(range(1, latest + 1))
+        self.flood = flood
+        self.requests = 0
+
+    async def get_messages(self, entity, limit, reverse=False, min_id=0, max_id=0):
+        assert entity == 'x'
+        self.requests += 1
+        if self.flood:
+            self.flood = False
+            raise FloodWaitError(request=None, capture=0)
+        found = [i for i in self.ids if min_id < i and (not max_id or i < max_id)]
+        page = found[:limit] if reverse else found[::-1][:limit]
+        out = TotalList(msg(i) for i in page)
+        out.total = len(self.ids)
+        return out
+
+
+def ids(path):
+    return [json.loads(line)['id'] for line in path.read_text().splitlines()]
+
+
+def test_make_plan_covers_range():
+    plan = main.make_plan(1000, 10_000, 4)
+
+    bounds = [(part['lo'], part['hi']) for part in plan['parts']]
+    assert bounds == [(1000, 3250), (3250, 5500), (5500, 7750), (7750, 10_000)]
+
+
+def test_make_plan_keeps_parts_wide():
+    assert len(main.make_plan(0, 2500, 8)['parts']) == 2
+
+
+def test_backfill_merges_parts_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'PART_MIN', 10)
+    p = tmp_path / 'tg_x.jl'
+    write_archive(p, [1, 2])
+    client = FakeClient(95)
+
+    last, count = asyncio.run(
+        main.backfill(client, 'x', p, 2, 95, 4, main.FloodGate(0), main.Progress('x', 2, 95))
+    )
+
+    assert (last, count) == (95, 95)
+    assert ids(p) == list(range(1, 96))
+    assert not main.plan_path(p).exists()
+    assert not list(tmp_path.glob('*.part*'))
+    assert main.resume_state(p) == (95, 95)
+
+
+def test_backfill_resumes_interrupted_parts(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'PART_MIN', 10)
+    p = tmp_path / 'tg_x.jl'
+    plan = main.make_plan(0, 60, 3)
+    plan['parts'][0]['done'] = True
+    main.save_plan(p, plan)
+    write_archive(main.part_path(p, 0), range(1, 21))
+    write_archive(main.part_path(p, 1), range(21, 30))  # cut off mid-part
+    client = FakeClient(60, flood=False)
+
+    asyncio.run(
+        main.backfill(client, 'x', p, 0, 60, 8, main.FloodGate(0), main.Progress('x', 0, 60))
+    )
+
+    assert ids(p) == list(range(1, 61))
+    assert client.requests == 4  # part 1 from id 29 and part 2, each + one empty page
+
+
+def test_merge_is_idempotent(tmp_path):
+    p = tmp_path / 'tg_x.jl'
+    plan = main.make_plan(0, 4, 1)
+    main.save_plan(p, plan)
+    write_archive(main.part_path(p, 0), [1, 2, 3, 4])
+    write_archive(p, [1, 2])  # crash after part of the merge was appended
+
+    assert main.merge_parts(p, plan) == (4, 4)
+    assert ids(p) == [1, 2, 3, 4]
+
+
+def test_archive_catches_up_and_skips_quiet_groups(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = FakeClient(250)
+
+    assert asyncio.run(main.archive(client, 'x', main.FloodGate(0), 'x')) == 250
+    assert ids(tmp_path / 'tmp' / 'tg_x.jl') == list(range(1, 251))
+    assert main.load_ckpt(tmp_path / 'tmp' / 'tg_x.jl')['count'] == 250
+
+    client.ids.append(251)
+    client.requests = 0
+    assert asyncio.run(main.archive(client, 'x', main.FloodGate(0), 'x')) == 1
+    assert client.requests == 2  # one page, one empty page; no head probe
+
+    client.requests = 0
+    assert asyncio.run(main.archive(client, 'x', main.FloodGate(0), 'x')) == 0
+    assert client.requests == 1
+
+
+class FakeResolver:
+    def __init__(self):
+        self.lookups = []
+
+    async def get_entity(self, group):
+        self.lookups.append(group)
+        return Channel(id=5, title='X chat', photo=ChatPhotoEmpty(), date=DATE, access_hash=77)
+
+
+def test_entity_cache_skips_lookups_until_expired(tmp_path):
+    path = tmp_path / 'entities.json'
+    client = FakeResolver()
+    gate = main.FloodGate(0)
+
+    async def resolve(ttl, group='x'):
+        return await main.EntityCache(path, ttl).resolve(client, gate, group)
+
+    assert asyncio.run(resolve(60)) == InputPeerChannel(5, 77)
+    assert asyncio.run(resolve(60)) == InputPeerChannel(5, 77)  # from disk, new instance
+    assert client.lookups == ['x']
+    assert json.loads(path.read_text())['x']['title'] == 'X chat'
+
+    asyncio.run(resolve(0))  # expired
+    main.EntityCache(path).drop('x')
+    asyncio.run(resolve(60))
+    assert client.lookups == ['x', 'x', 'x']
+
+
+def test_cfg_groups_accepts_single_group():
+    assert main.cfg_groups({'group': 'a'}) == ['a']
+    assert main.cfg_groups({'groups': ['a', 'b']}) == ['a', 'b']
+    assert main.session_path({'groups': ['a', 'b']}) == './tmp/session_a'
+
+
+def test_writer_flushes_queue_on_cancel(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'CKPT_EVERY', 2)
+    p = tmp_path / 'tg_x.jl'
+
+    async def fetch(started):
+        async with main.JsonlWriter(p, count=10, last=10) as w:
+            for i in range(11, 16):
+                await w.put({'id': i})
+            started.set()
+            await asyncio.sleep(60)  # Ctrl-C lands while waiting on the network
+
+    async def go():
+        started = asyncio.Event()
+        task = asyncio.create_task(fetch(started))
+        await started.wait()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    asyncio.run(go())
+
+    assert ids(p) == [11, 12, 13, 14, 15]
+    assert main.load_ckpt(p) == {'last_id': 15, 'count': 15, 'offset': p.stat().st_size}
+
+
+class FakeDownloader:
+    def __init__(self, content):
+        self.content = content  # file id -> bytes
+        self.downloads = []
+
+    async def download_media(self, m, file):
+        fid = main.media_file_id(m)
+        self.downloads.append(fid)
+        Path(file).write_bytes(self.content[fid])
+        return file
+
+
+def test_media_is_content_addressed(tmp_path):
+    # 1 and 2 are the same picture uploaded twice; 3 is too big
+    client = FakeDownloader({1: b'cat', 2: b'cat', 3: b'dog' * 10})
+    p = tmp_path / 'tg_x.jl'
+
+    async def go(msgs):
+        gate = main.FloodGate(0)
+        async with (
+            main.MediaStore(client, gate, max_bytes=10, root=tmp_path / 'media') as store,
+            main.JsonlWriter(p) as w,
+        ):
+            for m in msgs:
+                await w.put(main.to_record(m, store))
+
+    asyncio.run(go([msg(10, photo(1)), msg(11, photo(2)), msg(12, photo(3, 30)), msg(13)]))
+    asyncio.run(go([msg(14, photo(2))]))  # known file id: not downloaded again
+
+    files = [json.loads(line)['media_file'] for line in p.read_text().splitlines()]
+    digest = hashlib.sha256(b'cat').hexdigest()
+    assert files == [f'{digest[:2]}/{digest}.jpg'] * 2 + [None, None, f'{digest[:2]}/{digest}.jpg']
+    assert client.downloads == [1, 2]
+    assert len(list((tmp_path / 'media').glob('??/*'))) == 1
+
+
+class SlowDownloader(FakeDownloader):
+    def __init__(self, content):
+        super().__init__(content)
+        self.release = asyncio.Event()
+
+    async def download_media(self, m, file):
+        await self.release.wait()
+        return await super().download_media(m, file)
+
+
+def test_media_resubmitted_while_downloading_is_fetched_once(tmp_path):
+    client = SlowDownloader({9: b'cat'})
+
+    async def go():
+        async with main.MediaStore(client, main.FloodGate(0), root=tmp_path) as store:
+            first = store.submit(msg(10, photo(9)))
+            await asyncio.sleep(0.01)  # a worker has picked it up
+            second = store.submit(msg(11, photo(9)))
+            assert store.stored == 3  # reserved once
+            client.release.set()
+            return await first, await second, store.submit(msg(12, photo(9)))
+
+    first, second, third = asyncio.run(go())
+
+    assert first == second == third.result()
+    assert client.downloads == [9]
+    assert not list((tmp_path / '.incoming').iterdir())
+
+
+def test_follower_catches_up_after_archive(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = FakeClient(120, flood=False)
+    gate = main.FloodGate(0)
+    asyncio.run(main.archive(client, 'x', gate, 'x'))
+
+    async def go():
+        async with main.Follower(client, 'x', 'x', gate) as f:
+            client.ids += [121, 122]  # arrived while disconnected
+            assert await f.catch_up() == 2
+            assert await f.catch_up() == 0
+            await f.deleted([5, 6])
+
+    asyncio.run(go())
+
+    p = tmp_path / 'tmp' / 'tg_x.jl'
+    assert ids(p) == list(range(1, 123))
+    assert main.resume_state(p) == (122, 122)
+    evs = [json.loads(line) for line in main.events_path(p).read_text().splitlines()]
+    assert [(e['type'], e['id']) for e in evs] == [('delete', 5), ('delete', 6)]
+
+
+class FollowClient(FakeClient):
+    """Connected until told otherwise; the first reconnect attempt fails."""
+
+    def __init__(self, latest):
+        super().__init__(latest, flood=False)
+        self.connected = True
+        self.connects = 0
+        self.disconnected = asyncio.get_running_loop().create_future()
+
+    def add_event_handler(self, callback, event):
+        pass
+
+    def is_connected(self):
+        return self.connected
+
+    async def connect(self):
+        self.connects += 1
+        if self.connects == 1:
+            raise ConnectionError('still offline')
+        self.connected = True
+        self.disconnected = asyncio.get_running_loop().create_future()
+
+    async def get_messages(self, entity, **kwargs):
+        assert entity == InputPeerChannel(1, 2)
+        if not self.connected:
+            raise ConnectionError('not connected')
+        return await super().get_messages('x', **kwargs)
+
+
+def test_follow_survives_failed_disconnect(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, 'RECONNECT_BACKOFF', 0.01)
+
+    async def go():
+        client = FollowClient(5)
+        peers = {'x': InputPeerChannel(1, 2)}
+        task = asyncio.create_task(
+            main.follow_groups(client, ['x'], peers, main.FloodGate(0), check=0.01)
+        )
+        await asyncio.sleep(0.05)
+        client.connected = False  # auto-reconnect gave up
+        client.ids += [6, 7]
+        client.disconnected.set_exception(ConnectionError('gave up'))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        return client
+
+    client = asyncio.run(go())
+
+    assert client.connects == 2
+    assert ids(tmp_path / 'tmp' / 'tg_x.jl') == [1, 2, 3, 4, 5, 6, 7]
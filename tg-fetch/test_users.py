@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import users
+from telethon.helpers import TotalList
+from telethon.tl.types import User
+
+CAP = 3
+
+
+def user(id_, name):
+    return User(id=id_, first_name=name, username=name.lower())
+
+
+class Listing:
+    """Mimics telethon's participant iterator: at most CAP results, `.total` matches."""
+
+    def __init__(self, members, search):
+        self.matches = [u for u in members if u.first_name.lower().startswith(search)]
+        self.total = None
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        self.total = len(self.matches)
+        for u in self.matches[:CAP]:
+            yield u
+
+
+class FakeClient:
+    def __init__(self, members):
+        self.members = members
+        self.queries = []
+
+    def iter_participants(self, entity, search=''):
+        assert entity == 'g'
+        self.queries.append(search)
+        return Listing(self.members, search)
+
+    async def get_participants(self, entity, limit):
+        assert entity == 'g'
+        assert limit == 0
+        out = TotalList()
+        out.total = len(self.members)
+        return out
+
+
+def test_scan_splits_capped_listings():
+    names = ['Aa', 'Ab', 'Ac', 'Ad', 'Bo', 'Cy']
+    client = FakeClient([user(i, n) for i, n in enumerate(names)])
+
+    seen, complete = asyncio.run(users.scan(client, 'g', 'g', chars='abcd'))
+
+    assert complete
+    assert sorted(u['first_name'] for u in seen.values()) == names
+    # '' and 'a' hit the cap and get split; stops as soon as all 6 are seen
+    assert client.queries == ['', 'a', 'b', 'c', 'd', 'aa', 'ab', 'ac', 'ad']
+
+
+def test_scan_reports_incomplete():
+    client = FakeClient([user(1, 'Al'), user(2, 'Ann'), user(3, 'Amy'), user(4, '日本')])
+
+    seen, complete = asyncio.run(users.scan(client, 'g', 'g', chars='a'))
+
+    assert len(seen) == 3
+    assert not complete
+
+
+def test_deltas_replay_onto_snapshot(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    a = users.user_to_dict(user(1, 'Al'))
+    b = users.user_to_dict(user(2, 'Bo'))
+    users.write_snapshot('g', {1: a, 2: b})
+    b2 = {**b, 'username': 'bobby'}
+    c = users.user_to_dict(user(3, 'Cy'))
+
+    deltas = users.diff(users.load_known('g'), {2: b2, 3: c}, complete=True)
+    with open(users.delta_path('g'), 'a') as f:
+        f.writelines(json.dumps(d) + '\n' for d in deltas)
+
+    assert [(d['op'], d['id']) for d in deltas] == [('change', 2), ('add', 3), ('remove', 1)]
+    assert users.load_known('g') == {2: b2, 3: c}
+
+
+def test_incomplete_scan_keeps_unseen_users():
+    known = {1: {'id': 1}, 2: {'id': 2}}
+
+    assert users.diff(known, {2: {'id': 2}}, complete=False) == []
@@ -3,21 +3,31 @@
 # dependencies = ["telethon"]
 # ///
 
+import argparse
 import asyncio
+import contextlib
 import json
 import sys
-import tomllib
+from collections import Counter
+from datetime import UTC
+from datetime import datetime
 from pathlib import Path
 
+from main import ENTITIES
+from main import ENTITY_TTL
+from main import CountingClient
+from main import EntityCache
+from main import FloodGate
+from main import cfg_groups
+from main import load_cfg
+from main import login
+from main import session_path  # same login as main.py
 from telethon import TelegramClient
+from telethon.errors import RPCError
+from telethon.tl.types import ChannelParticipantsRecent
 from telethon.tl.types import User
 
 
-def load_cfg(path: str) -> dict:
-    with open(path, 'rb') as f:
-        return tomllib.load(f)
-
-
 def out_path(group: str) -> Path:
     p = Path('./tmp')
     p.mkdir(exist_ok=True)
@@ -36,38 +46,193 @@ def user_to_dict(u: User) -> dict:
     }
 
 
-async def run(cfg: dict) -> None:
-    group = cfg['group']
-    p = out_path(group)
+# --- known users: snapshot + delta log ---
 
-    session = f'./tmp/session_{group}'
-    client = TelegramClient(session, int(cfg['api_id']), cfg['api_hash'])
 
-    if 'bot_token' in cfg:
-        await client.start(bot_token=cfg['bot_token'])
-    else:
-        await client.start(phone=lambda: cfg['phone'])
+def delta_path(group: str) -> Path:
+    return out_path(group).with_name(f'tg_{group}_users.delta.jl')
+
 
-    async with client:
-        entity = await client.get_entity(group)
-        n = 0
-        with open(p, 'w') as f:  # noqa: ASYNC230
-            async for u in client.iter_participants(entity):
-                if not isinstance(u, User):
-                    continue
-                f.write(json.dumps(user_to_dict(u)) + '\n')
-                n += 1
-                if n % 500 == 0:
-                    print(f'fetched {n}')
+def load_known(group: str) -> dict[int, dict]:
+    """Users as of the last run: the snapshot with the delta log replayed."""
+    known = {}
+    for path in (out_path(group), delta_path(group)):
+        with contextlib.suppress(FileNotFoundError), open(path) as f:
+            for line in f:
+                with contextlib.suppress(json.JSONDecodeError, KeyError):
+                    r = json.loads(line)
+                    op = r.pop('op', 'add')
+                    r.pop('ts', None)
+                    if op == 'remove':
+                        known.pop(r['id'], None)
+                    else:
+                        known[r['id']] = r
+    return known
 
-    print(f'done — {n} users -> {p}')
+
+def diff(known: dict[int, dict], seen: dict[int, dict], complete: bool) -> list[dict]:
+    """Delta records turning `known` into `seen`; removals only from a complete scan."""
+    ts = datetime.now(UTC).isoformat(timespec='seconds')
+    out = []
+    for id_, u in seen.items():
+        if id_ not in known:
+            out.append({'op': 'add', 'ts': ts, **u})
+        elif known[id_] != u:
+            out.append({'op': 'change', 'ts': ts, **u})
+    if complete:
+        out.extend({'op': 'remove', 'ts': ts, 'id': id_} for id_ in known.keys() - seen.keys())
+    return out
+
+
+def write_snapshot(group: str, users: dict[int, dict]) -> None:
+    """Atomically replace the snapshot and drop the folded-in delta log."""
+    p = out_path(group)
+    tmp = p.with_name(f'{p.name}.tmp')
+    with open(tmp, 'w') as f:
+        f.writelines(json.dumps(u) + '\n' for u in users.values())
+    tmp.replace(p)
+    delta_path(group).unlink(missing_ok=True)
+
+
+# --- fetching ---
+
+SEARCH_CHARS = 'abcdefghijklmnopqrstuvwxyz0123456789'
+SEARCH_DEPTH = 3  # longest query prefix before giving up on splitting further
+
+
+async def collect(client: TelegramClient, entity, seen: dict, search: str = '') -> bool:
+    """Add one listing to `seen`; False if the server capped it below its match count."""
+    it = client.iter_participants(entity, search=search)
+    n = 0
+    async for u in it:
+        n += 1
+        if isinstance(u, User):
+            seen[u.id] = user_to_dict(u)
+    return n >= (it.total or 0)
+
+
+async def scan(client: TelegramClient, entity, group: str, chars: str = SEARCH_CHARS):
+    """All participants, splitting capped listings into name-prefix searches.
+
+    Returns (users, complete): complete means we saw as many users as the
+    group reports, so anyone missing really left.
+    """
+    total = (await client.get_participants(entity, limit=0)).total
+    seen = {}
+    queue = [] if await collect(client, entity, seen) else list(chars)
+    while queue and len(seen) < total:
+        q = queue.pop(0)
+        if not await collect(client, entity, seen, q) and len(q) < SEARCH_DEPTH:
+            queue.extend(q + c for c in chars)
+        print(f'{group}: {len(seen)}/{total} after "{q}"')
+    return seen, len(seen) >= total
+
+
+async def recent(client: TelegramClient, entity, limit: int) -> dict:
+    seen = {}
+    async for u in client.iter_participants(entity, limit=limit, filter=ChannelParticipantsRecent):
+        if isinstance(u, User):
+            seen[u.id] = user_to_dict(u)
+    return seen
+
+
+async def sync(
+    client: TelegramClient,
+    entity,
+    group,
+    recent_only: int = 0,
+    compact: bool = False,
+    chars: str = SEARCH_CHARS,
+) -> None:
+    known = load_known(group)
+    if recent_only and known:
+        seen, complete = await recent(client, entity, recent_only), False
+        seen = {k: u for k, u in seen.items() if known.get(k) != u}
+    else:
+        seen, complete = await scan(client, entity, group, chars)
+
+    if not out_path(group).exists():
+        write_snapshot(group, seen)
+        print(f'{group}: snapshot of {len(seen)} users -> {out_path(group)}')
+        return
+    if not complete and not recent_only:
+        print(f'{group}: scan incomplete, not recording removals', file=sys.stderr)
+
+    deltas = diff(known, seen, complete)
+    with open(delta_path(group), 'a') as f:  # noqa: ASYNC230
+        f.writelines(json.dumps(d) + '\n' for d in deltas)
+    ops = Counter(d['op'] for d in deltas)
+    print(
+        f'{group}: {ops["add"]} added, {ops["change"]} changed, {ops["remove"]} removed '
+        f'-> {delta_path(group)}'
+    )
+    if compact:
+        for d in deltas:
+            op = d.pop('op')
+            d.pop('ts')
+            if op == 'remove':
+                known.pop(d['id'])
+            else:
+                known[d['id']] = d
+        write_snapshot(group, known)
+        print(f'{group}: compacted {len(known)} users -> {out_path(group)}')
+
+
+async def run(
+    cfg: dict,
+    recent_only: int = 0,
+    compact: bool = False,
+    entity_ttl: float = ENTITY_TTL,
+    stats: bool = False,
+) -> None:
+    client = CountingClient(session_path(cfg), int(cfg['api_id']), cfg['api_hash'])
+    await login(client, cfg)
+
+    cache = EntityCache(ttl=entity_ttl)  # shared with main.py
+    gate = FloodGate(0)  # no pacing, just flood waits
+    chars = cfg.get('search_chars', SEARCH_CHARS)
+    try:
+        peers = {}
+        for group in cfg_groups(cfg):
+            try:
+                peers[group] = await cache.resolve(client, gate, group)
+            except (ValueError, RPCError) as e:
+                print(f'{group}: cannot resolve: {e!r}', file=sys.stderr)
+        if stats:
+            print(client.lap('start-up'))
+        for group, entity in peers.items():
+            await sync(client, entity, group, recent_only, compact, chars)
+        if stats:
+            print(client.lap('sync'))
+    finally:
+        await client.disconnect()
 
 
 def main() -> None:
-    if len(sys.argv) < 2:
-        print('usage: uv run users.py <config.toml>', file=sys.stderr)
-        sys.exit(1)
-    asyncio.run(run(load_cfg(sys.argv[1])))
+    ap = argparse.ArgumentParser(description='Track Telegram group participants.')
+    ap.add_argument('config', help='config.toml')
+    ap.add_argument(
+        '--recent',
+        type=int,
+        default=0,
+        metavar='N',
+        help='only check the N most recent joiners (adds and changes, no removals)',
+    )
+    ap.add_argument('--compact', action='store_true', help='fold the delta log into the snapshot')
+    ap.add_argument(
+        '--entity-ttl',
+        type=float,
+        default=ENTITY_TTL / 3600,
+        metavar='HOURS',
+        help=f'reuse groups resolved within this long from {ENTITIES} (default: 24; 0 = never)',
+    )
+    ap.add_argument(
+        '--stats', action='store_true', help='print network calls made during start-up and sync'
+    )
+    args = ap.parse_args()
+    asyncio.run(
+        run(load_cfg(args.config), args.recent, args.compact, args.entity_ttl * 3600, args.stats)
+    )
 
 
 if __name__ == '__main__':
@@ -6,27 +6,57 @@
 
 uv run main.py login USERNAME
 uv run main.py timeline USERNAME [--no-headless]
-uv run main.py user USERNAME target1 target2
+uv run main.py user USERNAME target1 target2 [-w 4 -r 60]
+uv run main.py serve USERNAME --profile   # warm browser on a local socket
+uv run main.py submit USERNAME target1 target2
 """
 
+import base64
 import json
 import logging
 import os
 import random
 import re
+import resource
+import shutil
+import socket
+import sqlite3
+import struct
+import subprocess
 import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from compression import zstd
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from contextlib import contextmanager
 from contextlib import suppress
 from datetime import UTC
 from datetime import datetime
+from functools import partial
+from functools import wraps
+from html import unescape
 from html.parser import HTMLParser
-from io import StringIO
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from itertools import chain
+from queue import Empty
+from queue import Queue
+from tempfile import TemporaryDirectory
+from time import monotonic
+from time import perf_counter
 from time import sleep
+from time import time
 from time import time_ns
+from urllib.parse import urlparse
 
 import click
 from selenium import webdriver
+from selenium.common.exceptions import InvalidSessionIdException
 from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import NoSuchWindowException
 from selenium.common.exceptions import StaleElementReferenceException
 from selenium.common.exceptions import TimeoutException
 from selenium.common.exceptions import WebDriverException
@@ -36,24 +66,155 @@ from selenium.webdriver.support.ui import WebDriverWait
 
 OUTDIR = './export'
 TIMEOUT = 15
-BACKOFF = 120
-BACKOFF_JITTER = 60
+SCROLL_POLL = 0.25  # s between page-growth checks after a scroll
+SCROLL_MAX = 5  # s to wait for new articles before calling the page idle
+IDLE_SCROLLS = 2  # idle scrolls in a row that end a round
+PAUSE_MIN = 30  # s, floor between timeline rounds
+PAUSE_MAX = 600  # s, ceiling between timeline rounds
+PAUSE_START = 120
+PAUSE_JITTER = 0.25
+ROUND_TARGET = 50  # new tweets per round the pause is tuned toward
 
 log = logging.getLogger('tw-fetch')
 
 
+# --- metrics ---
+
+
+class Metrics:
+    """Phase timings and event counters for one collection unit (a timeline
+    round or a user target), kept per thread so pooled workers don't mix.
+
+    `emit` appends one JSON line per unit to `jsonl` and rewrites `prom`, a
+    Prometheus textfile-collector file holding process-lifetime totals.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.phase_totals = Counter()
+        self.event_totals = Counter()
+        self.jsonl = None
+        self.prom = None
+
+    def _cur(self):
+        if not hasattr(self.local, 'phases'):
+            self.reset()
+        return self.local
+
+    def reset(self):
+        self.local.phases = Counter()
+        self.local.events = Counter()
+
+    @contextmanager
+    def phase(self, name):
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            self._cur().phases[name] += perf_counter() - t0
+
+    def count(self, name, n=1):
+        self._cur().events[name] += n
+
+    def instrument(self, driver):
+        """Count WebDriver commands; element calls also go through driver.execute."""
+        execute = driver.execute
+
+        def counted(*args, **kwargs):
+            self.count('webdriver_calls')
+            return execute(*args, **kwargs)
+
+        driver.execute = counted
+
+    def emit(self, unit, **extra):
+        cur = self._cur()
+        rec = {
+            'ts': time(),
+            'unit': unit,
+            **extra,
+            'phases': {k: round(v, 3) for k, v in cur.phases.items()},
+            'events': dict(cur.events),
+        }
+        if cur.events['tweets']:
+            rec['s_per_1k'] = round(sum(cur.phases.values()) * 1000 / cur.events['tweets'], 1)
+        with self.lock:
+            self.phase_totals.update(cur.phases)
+            self.event_totals.update(cur.events)
+            if self.jsonl:
+                with open(self.jsonl, 'a') as f:
+                    f.write(json.dumps(rec) + '\n')
+            if self.prom:
+                self._write_prom()
+        log.debug(f'metrics {unit}: {rec}')
+        self.reset()
+        return rec
+
+    def _write_prom(self):
+        lines = [
+            '# HELP tw_fetch_phase_seconds_total Wall time spent per collection phase.',
+            '# TYPE tw_fetch_phase_seconds_total counter',
+            *(
+                f'tw_fetch_phase_seconds_total{{phase="{k}"}} {v:.3f}'
+                for k, v in sorted(self.phase_totals.items())
+            ),
+            '# HELP tw_fetch_events_total WebDriver calls, tweets, duplicates, failures.',
+            '# TYPE tw_fetch_events_total counter',
+            *(
+                f'tw_fetch_events_total{{event="{k}"}} {v}'
+                for k, v in sorted(self.event_totals.items())
+            ),
+        ]
+        with open(f'{self.prom}.tmp', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(f'{self.prom}.tmp', self.prom)
+
+
+metrics = Metrics()
+
+
+class Recorder:
+    """Saves one snapshot per scroll pass for `bench`: every rendered article
+    (outerHTML plus the extracted fields) and the GraphQL payloads behind it."""
+
+    def __init__(self):
+        self.path = None
+        self.lock = threading.Lock()
+
+    def snap(self, driver, timeline, payloads=()):
+        with metrics.phase('record'):
+            try:
+                tweets = driver.execute_script(EXTRACT_JS, timeline, True)
+                url = driver.current_url
+            except WebDriverException:
+                log.debug('snapshot failed', exc_info=True)
+                return
+            rec = {'ts': time(), 'url': url, 'tweets': tweets, 'graphql': list(payloads)}
+            with self.lock, open(self.path, 'a') as f:
+                f.write(json.dumps(rec) + '\n')
+
+
+recorder = Recorder()
+
+
 # --- browser ---
 
 
 @contextmanager
-def browser(headless=True):
+def browser(headless=True, capture=False, profile=None):
     opts = webdriver.ChromeOptions()
     if headless:
         opts.add_argument('--headless')
+    if profile:
+        os.makedirs(profile, exist_ok=True)
+        opts.add_argument(f'--user-data-dir={os.path.abspath(profile)}')
+    if capture:
+        opts.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
     opts.add_argument('--no-sandbox')
     opts.add_argument('--disable-dev-shm-usage')
     opts.add_argument('--disable-gpu')
     driver = webdriver.Chrome(options=opts)
+    metrics.instrument(driver)
     try:
         yield driver
     finally:
@@ -62,6 +223,12 @@ def browser(headless=True):
 
 def inject_cookies(driver, cookies):
     driver.get('https://x.com')
+    if driver.get_cookie('auth_token'):
+        log.debug('session already authenticated, skipping cookie injection')
+        return
+    if not cookies:
+        log.warning('not logged in and no cookies to inject')
+        return
     for c in cookies:
         with suppress(Exception):
             driver.add_cookie(c)
@@ -72,80 +239,756 @@ def inject_cookies(driver, cookies):
 
 
 class _Strip(HTMLParser):
+    """Collects text nodes. One instance per thread, reset between tweets."""
+
     def __init__(self):
-        super().__init__()
-        self.reset()
-        self.strict = False
-        self.convert_charrefs = True
-        self.buf = StringIO()
+        super().__init__(convert_charrefs=True)
+        self.parts = []
 
     def handle_data(self, d):
-        self.buf.write(d)
+        self.parts.append(d)
+
+    def text(self, html):
+        self.reset()
+        self.parts.clear()
+        self.feed(html)
+        return ''.join(self.parts)
+
 
-    def result(self):
-        return self.buf.getvalue()
+_strip = threading.local()
+_TAG = re.compile(r"""</?[a-zA-Z](?:[^>"']|"[^"]*"|'[^']*')*>""")
+_RAW = re.compile(r'<[!?]|<(?:script|style)', re.IGNORECASE)
+_WS = re.compile(r'[ \n]{2,}|\n')
 
 
 def strip_tags(html):
-    s = _Strip()
-    s.feed(html)
-    return s.result()
+    """Text content of serialized HTML. Browser innerHTML takes the regex
+    path; comments, script/style and stray `<` go through the real parser."""
+    if '<' not in html and '&' not in html:
+        return html
+    if not _RAW.search(html):
+        text = _TAG.sub('', html)
+        if '<' not in text:
+            return unescape(text)
+    try:
+        s = _strip.parser
+    except AttributeError:
+        s = _strip.parser = _Strip()
+    return s.text(html)
 
 
-def parse_tweet(elem):
+def squash(text):
+    return _WS.sub(' ', text).strip()
+
+
+def tweet_id(link):
     try:
-        text_el = elem.find_element(By.XPATH, ".//div[@data-testid='tweetText']")
-        text = strip_tags(text_el.get_attribute('innerHTML')).replace('\n', ' ').strip()
-        text = re.sub(r'  +', ' ', text)
+        return int(link.split('/')[-1]) if link else None
+    except ValueError:
+        return None
 
-        author = elem.find_element(
-            By.XPATH, ".//div[@data-testid='User-Name']/div[2]/div/div/a/div/span"
-        ).get_attribute('innerHTML')
 
-        time_tag = elem.find_element(By.XPATH, './/time[@datetime]')
-        published = time_tag.get_attribute('datetime')
+def make_record(link, author, html, published):
+    id_ = tweet_id(link)
+    if id_ is None:
+        return None
+    text = squash(strip_tags(html))
+    try:
         ctime = (
             datetime.strptime(published, '%Y-%m-%dT%H:%M:%S.000Z').replace(tzinfo=UTC).timestamp()
         )
+    except (TypeError, ValueError):
+        return None
+    return {'id': id_, 'url': link, 'author': author, 'text': text, 'ctime': ctime}
+
 
+def tweet_link(elem):
+    """The permalink an article shows now, or None if it has none (yet)."""
+    try:
+        time_tag = elem.find_element(By.XPATH, './/time[@datetime]')
+        return time_tag.find_element(By.XPATH, '..').get_attribute('href')
+    except (NoSuchElementException, WebDriverException):
+        return None
+
+
+def parse_tweet(elem):
+    try:
+        html = elem.find_element(By.XPATH, ".//div[@data-testid='tweetText']").get_attribute(
+            'innerHTML'
+        )
+        author = elem.find_element(
+            By.XPATH, ".//div[@data-testid='User-Name']/div[2]/div/div/a/div/span"
+        ).get_attribute('innerHTML')
+        time_tag = elem.find_element(By.XPATH, './/time[@datetime]')
+        published = time_tag.get_attribute('datetime')
         link = time_tag.find_element(By.XPATH, '..').get_attribute('href')
-        if not link:
-            return None
+    except StaleElementReferenceException:
+        metrics.count('stale_elements')
+        return None
+    except (NoSuchElementException, WebDriverException):
+        metrics.count('parse_failures')
+        return None
+    r = make_record(link, author, html, published)
+    if r is None:
+        metrics.count('parse_failures')
+    return r
+
+
+# Same fields as parse_tweet's XPaths, for every article under arguments[0],
+# in one WebDriver round-trip instead of ~6 per article. Articles already
+# returned are tagged with their link, so later passes in the same page load
+# skip them; a recycled node showing another tweet has a different link.
+# With arguments[1] set (recording) nothing is skipped or tagged and each
+# item also carries the article's outerHTML.
+EXTRACT_JS = """
+const [root, snapshot] = arguments;
+const out = [];
+for (const a of root.querySelectorAll('article')) {
+  const time = a.querySelector('time[datetime]');
+  const url = time && time.parentElement.href;
+  if (!url || (!snapshot && a.dataset.twfSeen === url)) continue;
+  const text = a.querySelector("div[data-testid='tweetText']");
+  const author = a.querySelector(
+    "div[data-testid='User-Name'] > div:nth-of-type(2) > div > div > a > div > span");
+  if (!text || !author) continue;
+  const item = {
+    url: url,
+    author: author.innerHTML,
+    html: text.innerHTML,
+    published: time.getAttribute('datetime'),
+  };
+  if (snapshot) {
+    item.outer = a.outerHTML.replace(/ data-twf-seen="[^"]*"/, '');
+  } else {
+    a.dataset.twfSeen = url;
+  }
+  out.push(item);
+}
+return out;
+"""
+
+
+def extract_tweets(driver, timeline, existing):
+    """Batch-extract visible tweets, skipping ids already in `existing`."""
+    with metrics.phase('get_tweets'):
+        batch = driver.execute_script(EXTRACT_JS, timeline, False)
+    out = []
+    with metrics.phase('parse_tweet'):
+        for raw in batch:
+            id_ = tweet_id(raw['url'])
+            if id_ is not None and id_ in existing:
+                metrics.count('duplicates')
+                continue
+            r = make_record(raw['url'], raw['author'], raw['html'], raw['published'])
+            if r:
+                out.append(r)
+            else:
+                metrics.count('parse_failures')
+    return out
 
-        id_ = link.split('/')[-1]
+
+def new_tweets(driver, timeline, existing, extract='js', capture=None, handled=None):
+    """Tweets rendered since the last pass. `handled` holds the (element id,
+    link) pairs the XPath path already parsed this round, so a recycled node
+    showing another tweet is parsed again; the JS path tags the DOM."""
+    if capture:
+        return capture.tweets(existing)
+    if extract == 'js':
         try:
-            id_ = int(id_)
-        except ValueError:
-            return None
+            return extract_tweets(driver, timeline, existing)
+        except WebDriverException:
+            log.warning('js extraction failed, falling back to xpath', exc_info=True)
+    if handled is None:
+        handled = set()
+    fresh = []
+    with metrics.phase('get_tweets'):
+        for e in get_tweets(timeline):
+            key = (e.id, tweet_link(e))
+            if key not in handled:
+                fresh.append(e)
+                if key[1]:  # no link yet: look again next pass
+                    handled.add(key)
+    with metrics.phase('parse_tweet'):
+        return [r for r in map(parse_tweet, fresh) if r]
+
+
+# --- graphql capture ---
+
+HOME_OPS = ('HomeTimeline', 'HomeLatestTimeline')
+USER_OPS = ('UserTweets',)
+
+
+def find_key(obj, key):
+    """Yield every value stored under `key`, without descending into matches."""
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if k == key:
+                yield v
+            else:
+                yield from find_key(v, key)
+    elif isinstance(obj, list):
+        for v in obj:
+            yield from find_key(v, key)
+
+
+def decode_tweet(result, promoted=False):
+    if result.get('__typename') == 'TweetWithVisibilityResults':
+        result = result.get('tweet', {})
+    legacy = result.get('legacy')
+    if not legacy or 'rest_id' not in result:
+        return None  # TweetTombstone, TweetUnavailable
+    rt = legacy.get('retweeted_status_result', {}).get('result')
+    if rt:
+        r = decode_tweet(rt, promoted)
+        if r:
+            r['retweeted_by'] = decode_author(result)
+        return r
+
+    author = decode_author(result)
+    note = result.get('note_tweet', {}).get('note_tweet_results', {}).get('result', {})
+    ctime = datetime.strptime(legacy['created_at'], '%a %b %d %H:%M:%S %z %Y').timestamp()
+    id_ = int(result['rest_id'])
+    reply = legacy.get('in_reply_to_status_id_str')
+    quote = legacy.get('quoted_status_id_str')
+    return {
+        'id': id_,
+        'url': f'https://x.com/{author.lstrip("@")}/status/{id_}',
+        'author': author,
+        'text': squash(unescape(note.get('text') or legacy.get('full_text', ''))),
+        'ctime': ctime,
+        'reply_to': int(reply) if reply else None,
+        'quote_of': int(quote) if quote else None,
+        'media': [
+            m['media_url_https'] for m in legacy.get('extended_entities', {}).get('media', [])
+        ],
+        'promoted': promoted,
+    }
+
+
+def decode_author(result):
+    user = result.get('core', {}).get('user_results', {}).get('result', {})
+    name = user.get('core', {}).get('screen_name') or user.get('legacy', {}).get('screen_name')
+    return f'@{name}'  # same shape as the DOM handle span
+
+
+def decode_timeline(payload):
+    """Records from one HomeTimeline/UserTweets GraphQL response body."""
+    out = []
+    for instructions in find_key(payload, 'instructions'):
+        for ins in instructions:
+            entries = ins.get('entries') or ([ins['entry']] if 'entry' in ins else [])
+            for entry in entries:
+                promoted = entry.get('entryId', '').startswith('promoted')
+                for tr in find_key(entry.get('content', {}), 'tweet_results'):
+                    with suppress(KeyError, TypeError, ValueError):
+                        r = decode_tweet(tr.get('result', {}), promoted)
+                        if r:
+                            out.append(r)
+    return out
+
+
+class GraphqlCapture:
+    """Timeline GraphQL responses read off Chrome's performance (CDP) log.
+
+    Needs a driver from `browser(capture=True)`. Bodies are fetched with
+    Network.getResponseBody once Chrome reports the request finished.
+    """
 
-    except (NoSuchElementException, StaleElementReferenceException, WebDriverException):
-        return None
-    return {'id': id_, 'url': link, 'author': author, 'text': text, 'ctime': ctime}
+    def __init__(self, driver, ops):
+        self.driver = driver
+        self.ops = ops
+        self.pending = {}
+        self.last = []  # payloads behind the latest tweets() call, for the recorder
+
+    def reset(self):
+        self.driver.get_log('performance')
+        self.pending.clear()
+
+    def payloads(self):
+        for entry in self.driver.get_log('performance'):
+            msg = json.loads(entry['message'])['message']
+            params = msg.get('params', {})
+            if msg.get('method') == 'Network.responseReceived':
+                path = urlparse(params['response']['url']).path
+                if '/graphql/' in path and path.rsplit('/', 1)[-1] in self.ops:
+                    self.pending[params['requestId']] = path
+            elif msg.get('method') == 'Network.loadingFinished':
+                path = self.pending.pop(params.get('requestId'), None)
+                if path:
+                    yield from self._body(params['requestId'], path)
+
+    def _body(self, request_id, path):
+        try:
+            body = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+            data = body['body']
+            if body.get('base64Encoded'):
+                data = base64.b64decode(data)
+            yield json.loads(data)
+        except (WebDriverException, json.JSONDecodeError):
+            log.debug(f'no body for {path}', exc_info=True)
+
+    def tweets(self, existing):
+        with metrics.phase('get_tweets'):
+            payloads = self.last = list(self.payloads())
+        with metrics.phase('parse_tweet'):
+            records = [r for p in payloads for r in decode_timeline(p)]
+        fresh = [r for r in records if r['id'] not in existing]
+        metrics.count('duplicates', len(records) - len(fresh))
+        return fresh
 
 
 # --- i/o ---
 
 
-def seen_ids(path):
-    ids = set()
-    if not os.path.exists(path):
-        return ids
-    with open(path) as f:
-        for line in f:
+# An archive `<stem>.jl` is either that one file or, once rotation is on,
+# numbered segments `<stem>.000042.jl` listed in `<stem>.manifest.json`.
+# Sealed segments are zstd-compressed (`.jl.zst`); only the last is open for
+# appends. Byte offsets below are logical: uncompressed bytes across all
+# segments in order.
+
+SEGMENT_MB = 256
+
+
+def manifest_path(path):
+    return f'{path.removesuffix(".jl")}.manifest.json'
+
+
+def load_manifest(path):
+    mp = manifest_path(path)
+    if not os.path.exists(mp):
+        return None
+    with open(mp) as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    mp = manifest_path(path)
+    with open(f'{mp}.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    os.replace(f'{mp}.tmp', mp)
+
+
+def new_segment(path, n):
+    return {
+        'n': n,
+        'name': f'{os.path.basename(path).removesuffix(".jl")}.{n:06d}.jl',
+        'day': datetime.now(UTC).date().isoformat(),
+        'sealed': False,
+    }
+
+
+def segments(path):
+    """Archive files in record order as (file, uncompressed bytes, sealed)."""
+    manifest = load_manifest(path)
+    if manifest is None:
+        return [(path, os.path.getsize(path), False)] if os.path.exists(path) else []
+    d = os.path.dirname(path)
+    out = []
+    for seg in manifest['segments']:
+        f = os.path.join(d, seg['name'])
+        if seg['sealed']:
+            out.append((f, seg['bytes'], True))
+        else:
+            out.append((f, os.path.getsize(f) if os.path.exists(f) else 0, False))
+    return out
+
+
+def active_file(path):
+    manifest = load_manifest(path)
+    if manifest is None:
+        return path
+    return os.path.join(os.path.dirname(path), manifest['segments'][-1]['name'])
+
+
+def archive_size(path):
+    return sum(size for _, size, _ in segments(path))
+
+
+def iter_lines(path, start=0):
+    """Raw lines across all segments, from logical byte offset `start`."""
+    pos = 0
+    for f, size, sealed in segments(path):
+        if pos + size <= start or not size:
+            pos += size
+            continue
+        with zstd.open(f, 'rb') if sealed else open(f, 'rb') as fh:
+            if start > pos:
+                fh.seek(start - pos)
+            yield from fh
+        pos += size
+
+
+def iter_records(path):
+    """Stream records of an archive, plain or segmented, in write order."""
+    for line in iter_lines(path):
+        stripped = line.strip()
+        if stripped:
+            with suppress(json.JSONDecodeError):
+                yield json.loads(stripped)
+
+
+def open_segments(path):
+    """Load (or start) the manifest, finishing any interrupted migration or seal."""
+    d = os.path.dirname(path)
+    manifest = load_manifest(path)
+    if manifest is None:
+        manifest = {'segments': [new_segment(path, 0)]}
+        save_manifest(path, manifest)
+    active = os.path.join(d, manifest['segments'][-1]['name'])
+    if os.path.exists(path) and not os.path.exists(active):
+        log.info(f'{path}: moving to segment {active}')
+        os.replace(path, active)
+    for seg in manifest['segments'][:-1]:
+        plain = os.path.join(d, seg['name'].removesuffix('.zst'))
+        if os.path.exists(plain):
+            os.remove(plain)  # sealed copy is in the manifest already
+    return manifest
+
+
+def seal_segment(path, manifest):
+    """Compress the active segment, then open the next one."""
+    d = os.path.dirname(path)
+    seg = manifest['segments'][-1]
+    src = os.path.join(d, seg['name'])
+    dst = f'{src}.zst'
+    records = 0
+    with open(src, 'rb') as fi, zstd.open(f'{dst}.tmp', 'wb') as fo:
+        while chunk := fi.read(1 << 20):
+            fo.write(chunk)
+            records += chunk.count(b'\n')
+    os.replace(f'{dst}.tmp', dst)
+    seg.update(name=os.path.basename(dst), bytes=os.path.getsize(src), records=records, sealed=True)
+    manifest['segments'].append(new_segment(path, seg['n'] + 1))
+    save_manifest(path, manifest)
+    os.remove(src)
+    log.info(f'sealed {dst} ({records} records)')
+
+
+IDX_MAGIC = b'TWIDX\x00\x00\x01'
+IDX_HEAD = struct.Struct('<8sqq')  # magic, sorted count, archive bytes covered
+IDX_COMPACT = 4096
+
+
+class IdIndex:
+    """Sidecar tweet-id index for one archive (`<archive>.idx`).
+
+    Layout: header, then `nsorted` ascending int64 ids, then ids appended
+    unsorted since the last compaction. Loading reads packed ints (no JSON),
+    lookups bisect the sorted block, RAM is ~8 bytes/id instead of a set.
+    The header records how many archive bytes the index covers; a longer
+    archive is caught up from that offset, a shorter one forces a rebuild.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.idx = f'{path}.idx'
+        self.base = array('q')
+        self.tail = set()
+        self.pending = []
+        self.covered = 0
+        if self._load():
+            self._catch_up()
+            self.sync()
+        else:
+            if archive_size(path):
+                log.info(f'{self.idx}: building from {path}')
+            self._catch_up()
+            self._write()
+
+    def __contains__(self, id_):
+        if id_ in self.tail:
+            return True
+        i = bisect_left(self.base, id_)
+        return i < len(self.base) and self.base[i] == id_
+
+    def __len__(self):
+        return len(self.base) + len(self.tail)
+
+    def claim(self, id_):
+        """Add `id_`; False if it was already seen."""
+        if id_ in self:
+            return False
+        self.tail.add(id_)
+        self.pending.append(id_)
+        return True
+
+    def add(self, id_):
+        self.claim(id_)
+
+    def sync(self):
+        """Persist ids added since the last sync; call after the archive is flushed."""
+        self.covered = archive_size(self.path)
+        if len(self.tail) > max(IDX_COMPACT, len(self.base) // 8):
+            self._write()
+            return
+        with open(self.idx, 'r+b') as f:
+            f.seek(0, os.SEEK_END)
+            f.write(array('q', self.pending).tobytes())
+            f.seek(0)
+            f.write(IDX_HEAD.pack(IDX_MAGIC, len(self.base), self.covered))
+        self.pending.clear()
+
+    def _load(self):
+        if not os.path.exists(self.idx):
+            return False
+        with open(self.idx, 'rb') as f:
+            head = f.read(IDX_HEAD.size)
+            if len(head) < IDX_HEAD.size:
+                return False
+            magic, nsorted, covered = IDX_HEAD.unpack(head)
+            if magic != IDX_MAGIC or covered > archive_size(self.path):
+                log.info(f'{self.idx}: stale, rebuilding')
+                return False
+            ids = array('q')
+            data = f.read()
+            ids.frombytes(data[: len(data) - len(data) % ids.itemsize])
+        if len(ids) < nsorted:
+            return False
+        self.base = ids[:nsorted]
+        self.tail = set(ids[nsorted:])
+        self.covered = covered
+        return True
+
+    def _catch_up(self):
+        """Index records written after `covered` (crash before the last sync)."""
+        if archive_size(self.path) <= self.covered:
+            return
+        for line in iter_lines(self.path, self.covered):
+            self.covered += len(line)
             stripped = line.strip()
             if stripped:
-                with suppress(json.JSONDecodeError, KeyError):
-                    ids.add(json.loads(stripped)['id'])
-    return ids
+                with suppress(json.JSONDecodeError, KeyError, TypeError):
+                    self.add(json.loads(stripped)['id'])
+
+    def _write(self):
+        ids = array('q', sorted(chain(self.base, self.tail)))
+        tmp = f'{self.idx}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(IDX_HEAD.pack(IDX_MAGIC, len(ids), self.covered))
+            ids.tofile(f)
+        os.replace(tmp, self.idx)
+        self.base = ids
+        self.tail = set()
+        self.pending.clear()
+
+
+SEEN_DB = 'seen.db'
+SEEN_BUSY = 30  # seconds to wait for another writer's claim transaction
+SEEN_CHUNK = 10_000
+SEEN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen (id INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS sources (
+  path TEXT PRIMARY KEY,
+  covered INTEGER NOT NULL,
+  records INTEGER NOT NULL
+);
+"""
+
+
+class SeenStore:
+    """Seen-set shared by every archive and process (`--shared-seen`).
+
+    One SQLite table of tweet ids under OUTDIR, in WAL mode so readers never
+    block. `claim` is INSERT OR IGNORE inside a write transaction that stays
+    open until `sync`, i.e. until the archive has been flushed: a crash in
+    between rolls the claims back with the records. Every process sees ids
+    claimed by the others once they commit, and waits up to SEEN_BUSY for
+    a competing claim. `sources` keeps, per archive, how many bytes were
+    indexed, so records written after the last commit are caught up on open.
+    """
+
+    path = None
+
+    def __init__(self, archive, db=None):
+        self.db_path = db or self.path
+        self.archive = archive
+        self.source = os.path.relpath(archive, os.path.dirname(self.db_path))
+        self.db = sqlite3.connect(self.db_path, timeout=SEEN_BUSY, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SEEN_SCHEMA)
+        row = self.db.execute(
+            'SELECT covered, records FROM sources WHERE path = ?', (self.source,)
+        ).fetchone()
+        self.covered, self.records = row or (0, 0)
+        self._catch_up()
+
+    def __contains__(self, id_):
+        return self.db.execute('SELECT 1 FROM seen WHERE id = ?', (id_,)).fetchone() is not None
+
+    def __len__(self):
+        return self.records
+
+    def claim(self, id_):
+        """Add `id_`; False if this or any other archive already has it."""
+        self._begin()
+        if self.db.execute('INSERT OR IGNORE INTO seen VALUES (?)', (id_,)).rowcount:
+            self.records += 1
+            return True
+        return False
+
+    def add(self, id_):
+        self.claim(id_)
+
+    def sync(self):
+        """Commit claims; call after the archive is flushed."""
+        size = archive_size(self.archive)
+        if not self.db.in_transaction and size == self.covered:
+            return
+        self._begin()
+        self.covered = size
+        self._commit()
+
+    def close(self):
+        self.db.close()
+
+    def _begin(self):
+        if not self.db.in_transaction:
+            self.db.execute('BEGIN IMMEDIATE')
+
+    def _commit(self):
+        self.db.execute(
+            'INSERT OR REPLACE INTO sources VALUES (?, ?, ?)',
+            (self.source, self.covered, self.records),
+        )
+        self.db.execute('COMMIT')
+
+    def _catch_up(self):
+        size = archive_size(self.archive)
+        if self.covered > size:
+            log.info(f'{self.archive}: shorter than {self.db_path} recorded, rescanning')
+            self.covered = self.records = 0
+        if size <= self.covered:
+            return
+        log.info(f'{self.db_path}: indexing {self.archive} from byte {self.covered}')
+        ids = []
+        for line in iter_lines(self.archive, self.covered):
+            self.covered += len(line)
+            stripped = line.strip()
+            if stripped:
+                with suppress(json.JSONDecodeError, KeyError, TypeError):
+                    ids.append((json.loads(stripped)['id'],))
+                    self.records += 1
+            if len(ids) >= SEEN_CHUNK:
+                self._insert(ids)
+        self._insert(ids)
+
+    def _insert(self, ids):
+        self._begin()
+        self.db.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ids)
+        self._commit()
+        ids.clear()
+
+
+def seen_ids(path):
+    repair_tail(active_file(path))
+    if SeenStore.path:
+        return SeenStore(path)
+    return IdIndex(path)
+
+
+def repair_tail(path):
+    """Truncate a torn last line left by a crash mid-write."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r+b') as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            step = min(pos, 1 << 16)
+            f.seek(pos - step)
+            chunk = f.read(step)
+            nl = chunk.rfind(b'\n')
+            if nl >= 0:
+                pos = pos - step + nl + 1
+                break
+            pos -= step
+        if pos < end:
+            log.warning(f'{path}: dropping {end - pos} bytes of torn last line')
+            f.truncate(pos)
+
+
+DURABILITY = ('record', 'batch', 'round')
+FLUSH_MS = 1000
+
 
+class JsonlWriter:
+    """Buffered JSONL appender.
 
-def append(f, record, existing):
-    if record['id'] in existing:
+    Records are serialized and written together once per scroll pass
+    (`flush`) or when the buffer is FLUSH_MS old. fsync cadence follows
+    `durability`: `record` syncs every record, `batch` every flush, `round`
+    only on close. Lines are always written whole; `repair_tail` drops a
+    torn one on reopen.
+    """
+
+    def __init__(
+        self, path, durability='batch', flush_ms=FLUSH_MS, rotate=None, segment_mb=SEGMENT_MB
+    ):
+        self.path = path
+        self.durability = durability
+        self.flush_ms = flush_ms
+        if rotate is None and load_manifest(path) is not None:
+            rotate = 'size'  # segmented archives stay segmented
+        self.rotate = rotate
+        self.segment_bytes = segment_mb << 20
+        self.manifest = open_segments(path) if rotate else None
+        self.buf = []
+        self.since = monotonic()
+        self._open()
+
+    def _open(self):
+        self.file = active_file(self.path)
+        repair_tail(self.file)
+        self.f = open(self.file, 'a')  # noqa: SIM115
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, record):
+        if not self.buf:
+            self.since = monotonic()
+        self.buf.append(record)
+        if self.durability == 'record' or (monotonic() - self.since) * 1000 >= self.flush_ms:
+            self.flush()
+
+    def flush(self):
+        if self.buf:
+            self.f.write(''.join(json.dumps(r) + '\n' for r in self.buf))
+            self.buf.clear()
+        self.f.flush()
+        if self.durability != 'round':
+            os.fsync(self.f.fileno())
+        if self.manifest and self._due():
+            os.fsync(self.f.fileno())
+            self.f.close()
+            seal_segment(self.path, self.manifest)
+            self._open()
+
+    def _due(self):
+        seg = self.manifest['segments'][-1]
+        if self.rotate == 'day':
+            today = datetime.now(UTC).date().isoformat()
+            if self.f.tell() == 0:
+                seg['day'] = today  # never seal an empty segment
+            return seg['day'] != today
+        return 0 < self.f.tell() >= self.segment_bytes
+
+    def close(self):
+        self.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+
+def append(w, record, existing):
+    if not existing.claim(record['id']):
         return False
-    existing.add(record['id'])
     record['collected_at'] = time_ns()
-    f.write(json.dumps(record) + '\n')
-    f.flush()
+    w.write(record)
     return True
 
 
@@ -157,97 +1000,416 @@ def wait_timeline(driver, label='Timeline'):
     return WebDriverWait(driver, TIMEOUT).until(visibility_of_element_located(condition))
 
 
-def scroll_down(driver):
-    driver.execute_script('window.scrollTo(0, document.body.scrollHeight);')
-    sleep(2 + random.random())  # noqa: S311
+class RateLimiter:
+    """Spaces page loads and scrolls across all browser sessions to `per_min`."""
+
+    def __init__(self, per_min):
+        self.interval = 60 / per_min if per_min > 0 else 0
+        self.next = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = monotonic()
+            slot = max(now, self.next)
+            self.next = slot + self.interval
+        sleep(slot - now)
+
+
+PAGE_STATE_JS = "return [document.querySelectorAll('article').length, document.body.scrollHeight];"
+SCROLL_JS = 'const s = (() => {' + PAGE_STATE_JS + '})(); window.scrollTo(0, s[1]); return s;'
+
+
+def scroll_down(driver, limiter=None):
+    """Scroll to the bottom and wait until the article count or page height
+    changes (or SCROLL_MAX passes). Returns whether the page grew."""
+    if limiter:
+        limiter.wait()
+    before = driver.execute_script(SCROLL_JS)
+    deadline = monotonic() + SCROLL_MAX
+    while monotonic() < deadline:
+        sleep(SCROLL_POLL)
+        if driver.execute_script(PAGE_STATE_JS) != before:
+            return True
+    return False
+
+
+class Pacer:
+    """Pause between timeline rounds, steered by the recent new-tweet rate.
+
+    The pause is what it would take to accumulate ROUND_TARGET tweets at the
+    smoothed rate, clamped to [floor, ceil]; a quiet timeline doubles it.
+    """
+
+    def __init__(self, floor=PAUSE_MIN, ceil=PAUSE_MAX, target=ROUND_TARGET, alpha=0.5):
+        self.floor = floor
+        self.ceil = ceil
+        self.target = target
+        self.alpha = alpha
+        self.pause = min(max(PAUSE_START, floor), ceil)
+        self.rate = None  # new tweets/s, exponentially smoothed
+
+    def next(self, n, elapsed):
+        """Pause after a round that found `n` new tweets in `elapsed` seconds."""
+        rate = n / max(elapsed + self.pause, 1)
+        self.rate = rate if self.rate is None else self.alpha * rate + (1 - self.alpha) * self.rate
+        if self.rate > 0:
+            pause = self.target / self.rate
+        else:
+            pause = self.pause * 2
+        self.pause = min(max(pause, self.floor), self.ceil)
+        return self.pause * (1 + random.random() * PAUSE_JITTER)  # noqa: S311
 
 
 def get_tweets(timeline):
     return timeline.find_elements(By.XPATH, './/article')
 
 
+def scroll_collect(
+    driver,
+    timeline,
+    f,
+    existing,
+    label='Timeline',
+    scrolls=30,
+    patience=3,
+    extract='js',
+    capture=None,
+    limiter=None,
+):
+    """Scroll `timeline`, appending new tweets until `patience` empty passes
+    or IDLE_SCROLLS scrolls in a row leave the page unchanged."""
+    n = 0
+    stale = 0
+    idle = 0
+    handled = set()
+    for _ in range(scrolls):
+        batch = 0
+        records = new_tweets(driver, timeline, existing, extract, capture, handled)
+        if recorder.path:
+            recorder.snap(driver, timeline, capture.last if capture else ())
+        with metrics.phase('append'):
+            for r in records:
+                if append(f, r, existing):
+                    batch += 1
+                    n += 1
+                    log.info(f'@{r["author"]}: {r["text"][:80]}')
+                else:
+                    metrics.count('duplicates')
+            f.flush()
+            existing.sync()
+
+        if batch == 0:
+            stale += 1
+            if stale >= patience:
+                break
+        else:
+            stale = 0
+
+        with metrics.phase('scroll_down'):
+            grew = scroll_down(driver, limiter)
+        if grew:
+            idle = 0
+        else:
+            idle += 1
+            if idle >= IDLE_SCROLLS:
+                log.debug('page stopped growing')
+                break
+        try:
+            with metrics.phase('wait_timeline'):
+                timeline = wait_timeline(driver, label)
+        except TimeoutException:
+            break
+    metrics.count('tweets', n)
+    return n
+
+
+# --- bench ---
+
+REPLAY_PAGE = (
+    '<!doctype html><html><head><meta charset="utf-8"></head><body><main><section>'
+    '<div aria-label="Timeline: replay">{}</div></section></main></body></html>'
+)
+
+
+def load_snapshots(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@contextmanager
+def replay_server(pages):
+    """Serve `pages[i]` at http://127.0.0.1:<port>/<i> from a background thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            try:
+                body = pages[int(self.path.strip('/'))].encode()
+            except (ValueError, IndexError):
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        yield f'http://127.0.0.1:{srv.server_port}'
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def replay_text(snaps):
+    """Only the html -> text normalization, over every recorded article."""
+    n = 0
+    for snap in snaps:
+        for raw in snap['tweets']:
+            squash(strip_tags(raw['html']))
+            n += 1
+    return n
+
+
+def replay_python(snaps, existing, w):
+    """Parse + dedupe + append straight from recorded fields, no browser."""
+    n = 0
+    for snap in snaps:
+        for raw in snap['tweets']:
+            id_ = tweet_id(raw['url'])
+            if id_ is None or id_ in existing:
+                continue
+            r = make_record(raw['url'], raw['author'], raw['html'], raw['published'])
+            n += bool(r and append(w, r, existing))
+        w.flush()
+        existing.sync()
+    return n
+
+
+def replay_graphql(snaps, existing, w):
+    n = 0
+    for snap in snaps:
+        for payload in snap['graphql']:
+            n += sum(append(w, r, existing) for r in decode_timeline(payload))
+        w.flush()
+        existing.sync()
+    return n
+
+
+def replay_browser(snaps, existing, w, extract, headless=True):
+    """Load each snapshot as a static page and run the live extraction path."""
+    pages = [REPLAY_PAGE.format(''.join(t['outer'] for t in snap['tweets'])) for snap in snaps]
+    n = 0
+    with replay_server(pages) as base, browser(headless) as driver:
+        metrics.reset()  # don't bill browser start-up to the replay
+        for i in range(len(pages)):
+            driver.get(f'{base}/{i}')
+            timeline = wait_timeline(driver, 'Timeline')
+            for r in new_tweets(driver, timeline, existing, extract, handled=set()):
+                n += append(w, r, existing)
+            w.flush()
+            existing.sync()
+    return n
+
+
+RSS_SAMPLE = 0.1  # seconds between process-tree RSS samples
+
+
+def tree_rss_mb(root):
+    """Summed RSS of `root` and all its descendants, from /proc; None elsewhere.
+
+    Chrome's renderers are grandchildren (under chromedriver), so rusage
+    never sees them.
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    parent, rss = {}, {}
+    for d in os.listdir('/proc'):
+        if not d.isdigit():
+            continue
+        with suppress(OSError, ValueError, IndexError), open(f'/proc/{d}/stat') as f:
+            stat = f.read()
+            fields = stat[stat.rindex(')') + 2 :].split()  # comm may hold spaces
+            parent[int(d)] = int(fields[1])
+            rss[int(d)] = int(fields[21])
+    children = {}
+    for pid, ppid in parent.items():
+        children.setdefault(ppid, []).append(pid)
+    pages, todo = 0, [root]
+    while todo:
+        pid = todo.pop()
+        pages += rss.get(pid, 0)
+        todo += children.get(pid, [])
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1 << 20)
+
+
+@contextmanager
+def peak_rss_mb():
+    """Yields a dict filled on exit with this process's and the whole tree's peak RSS.
+
+    Run one mode per process: ru_maxrss is a lifetime high-water mark.
+    """
+    peak = {'self': None, 'tree': None}
+    done = threading.Event()
+
+    def sample():
+        while True:
+            mb = tree_rss_mb(os.getpid())
+            if mb is not None:
+                peak['tree'] = max(peak['tree'] or 0, mb)
+            if done.wait(RSS_SAMPLE):
+                return
+
+    t = threading.Thread(target=sample, daemon=True)
+    t.start()
+    try:
+        yield peak
+    finally:
+        done.set()
+        t.join()
+        peak['self'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        if peak['tree'] is not None:
+            peak['tree'] = max(round(peak['tree'], 1), peak['self'])
+
+
 # --- commands ---
 
 COOKIE_DIR = './cookies'
+PROFILE_DIR = './profiles'
+SOCKET_DIR = './tmp'
 
 
 def cookie_path(username):
     return os.path.join(COOKIE_DIR, f'{username}.json')
 
 
-def load_cookies(username):
+PROFILE_SKIP = shutil.ignore_patterns('Singleton*', 'Cache', 'Code Cache', 'GPUCache')
+
+
+def profile_path(username, worker=0):
+    """Chrome user-data-dir for an account.
+
+    Chrome locks a profile to one instance, so extra workers get a copy of
+    the logged-in one, made on first use without its lock files and caches.
+    Delete `<user>-N` to re-copy after logging in again.
+    """
+    base = os.path.join(PROFILE_DIR, username)
+    if worker == 0:
+        return base
+    path = f'{base}-{worker}'
+    if not os.path.exists(path) and os.path.isdir(base):
+        shutil.copytree(base, path, symlinks=True, ignore=PROFILE_SKIP)
+    return path
+
+
+def load_cookies(username, required=True):
     path = cookie_path(username)
     if not os.path.exists(path):
+        if not required:
+            return []
         click.echo(f'error: {path} not found, run: uv run main.py login {username}', err=True)
         sys.exit(1)
     with open(path) as f:
         return json.load(f)
 
 
-def collect_round(driver, existing, path):
+def collect_round(driver, existing, path, extract='js', capture=None, writer=JsonlWriter):
     """One collection round: scroll timeline, parse, write new tweets."""
     try:
-        driver.get('https://x.com')
-        sleep(3)
-        # click Following tab if present
-        try:
-            tab = driver.find_element(
-                By.XPATH, "//div[@role='tablist']//span[contains(text(),'Following')]"
-            )
-            tab.click()
-            sleep(2)
-        except (NoSuchElementException, WebDriverException):
-            pass
-
-        timeline = wait_timeline(driver)
+        with metrics.phase('load'):
+            driver.get('https://x.com')
+            sleep(3)
+            # click Following tab if present
+            try:
+                tab = driver.find_element(
+                    By.XPATH, "//div[@role='tablist']//span[contains(text(),'Following')]"
+                )
+                if capture:
+                    capture.reset()  # drop the For You payload loaded before the tab switch
+                tab.click()
+                sleep(2)
+            except (NoSuchElementException, WebDriverException):
+                pass
+
+        with metrics.phase('wait_timeline'):
+            timeline = wait_timeline(driver)
     except TimeoutException:
         log.exception('could not load timeline')
         return 0
 
-    n = 0
-    stale = 0
-    with open(path, 'a') as f:
-        for _ in range(30):
-            batch = 0
-            for tag in get_tweets(timeline):
-                r = parse_tweet(tag)
-                if r and append(f, r, existing):
-                    batch += 1
-                    n += 1
-                    log.info(f'@{r["author"]}: {r["text"][:80]}')
+    with writer(path) as f:
+        return scroll_collect(driver, timeline, f, existing, extract=extract, capture=capture)
 
-            if batch == 0:
-                stale += 1
-                if stale >= 3:
-                    break
-            else:
-                stale = 0
 
-            scroll_down(driver)
-            try:
-                timeline = wait_timeline(driver)
-            except TimeoutException:
-                break
+def archive_options(f):
+    """Archive write options, handed to the command as one `writer` factory."""
 
-    return n
+    @click.option(
+        '--durability',
+        type=click.Choice(DURABILITY),
+        default='batch',
+        help='fsync every record, every scroll pass (batch), or at round end.',
+    )
+    @click.option(
+        '--rotate',
+        type=click.Choice(['day', 'size']),
+        default=None,
+        help='Split the archive into zstd-sealed segments.',
+    )
+    @click.option('--segment-mb', type=int, default=SEGMENT_MB, help='Segment size, --rotate size.')
+    @wraps(f)
+    def wrapper(*args, durability, rotate, segment_mb, **kwargs):
+        if SeenStore.path and durability == 'round':
+            # claims commit every scroll pass; the lines behind them must be on disk
+            raise click.UsageError('--shared-seen needs --durability batch or record')
+        writer = partial(JsonlWriter, durability=durability, rotate=rotate, segment_mb=segment_mb)
+        return f(*args, writer=writer, **kwargs)
+
+    return wrapper
 
 
 @click.group()
 @click.option('--debug', is_flag=True)
-def main(debug):
+@click.option(
+    '--metrics', 'metrics_file', type=click.Path(), help='Append per-round metrics (JSONL).'
+)
+@click.option('--prom', type=click.Path(), help='Prometheus textfile with running totals.')
+@click.option('--record', type=click.Path(), help='Append page snapshots for `bench` (JSONL).')
+@click.option(
+    '--shared-seen', is_flag=True, help=f'Dedupe across all archives via {OUTDIR}/{SEEN_DB}.'
+)
+def main(debug, metrics_file, prom, record, shared_seen):
     """Twitter/X dump - archive tweets to JSONL."""
     logging.basicConfig(
         level=logging.DEBUG if debug else logging.INFO,
         format='%(asctime)s %(levelname)s %(name)s: %(message)s',
     )
+    metrics.jsonl = metrics_file
+    metrics.prom = prom
+    recorder.path = record
+    if shared_seen:
+        os.makedirs(OUTDIR, exist_ok=True)
+        SeenStore.path = os.path.join(OUTDIR, SEEN_DB)
 
 
 @main.command()
 @click.argument('username')
 @click.option('--headless/--no-headless', default=True)
-def timeline(username, headless):
+@click.option('--extract', type=click.Choice(['js', 'xpath']), default='js')
+@click.option('--capture', is_flag=True, help='Read tweets from GraphQL responses, not the DOM.')
+@click.option('--min-wait', type=float, default=PAUSE_MIN, help='Shortest pause between rounds.')
+@click.option('--max-wait', type=float, default=PAUSE_MAX, help='Longest pause between rounds.')
+@click.option('--target', type=int, default=ROUND_TARGET, help='New tweets per round to aim for.')
+@click.option('--profile', is_flag=True, help='Reuse the persistent Chrome profile from login.')
+@archive_options
+def timeline(username, headless, extract, capture, min_wait, max_wait, target, profile, writer):
     """Dump home timeline continuously."""
-    cookies = load_cookies(username)
+    cookies = load_cookies(username, required=not profile)
     os.makedirs(OUTDIR, exist_ok=True)
     path = os.path.join(OUTDIR, f'timeline_{username}.jl')
     existing = seen_ids(path)
@@ -256,79 +1418,327 @@ def timeline(username, headless):
     if existing:
         log.info(f'resuming, {total} tweets on disk')
 
-    with browser(headless) as driver:
+    with browser(headless, capture, profile_path(username) if profile else None) as driver:
         inject_cookies(driver, cookies)
+        gql = GraphqlCapture(driver, HOME_OPS) if capture else None
+        pacer = Pacer(min_wait, max_wait, target)
         rounds = 0
         while True:
             rounds += 1
-            n = collect_round(driver, existing, path)
+            t0 = monotonic()
+            n = collect_round(driver, existing, path, extract, gql, writer)
+            elapsed = monotonic() - t0
             total += n
-            wait = BACKOFF + random.random() * BACKOFF_JITTER  # noqa: S311
-            log.info(f'round {rounds}: {n} new, {total} total. sleeping {wait:.0f}s')
+            wait = pacer.next(n, elapsed)
+            log.info(
+                f'round {rounds}: {n} new in {elapsed:.0f}s, {total} total, '
+                f'rate {pacer.rate * 60:.1f}/min. sleeping {wait:.0f}s'
+            )
+            metrics.emit('timeline', round=rounds, new=n, elapsed=round(elapsed, 3), pause=wait)
             sleep(wait)
 
 
+def dump_user(driver, target, extract='js', capture=None, limiter=None, writer=JsonlWriter):
+    """Archive one profile into its own `user_<target>.jl`; returns new tweet count."""
+    safe = target.lstrip('@')
+    path = os.path.join(OUTDIR, f'user_{safe}.jl')
+    existing = seen_ids(path)
+
+    if existing:
+        log.info(f'@{safe}: {len(existing)} tweets on disk')
+
+    metrics.reset()
+    t0 = monotonic()
+    if capture:
+        capture.reset()
+    if limiter:
+        limiter.wait()
+    with metrics.phase('load'):
+        driver.get(f'https://x.com/{safe}')
+        sleep(3)
+
+    try:
+        with metrics.phase('wait_timeline'):
+            timeline = wait_timeline(driver, 'Timeline')
+    except TimeoutException:
+        log.exception(f'@{safe}: no timeline found')
+        return 0
+
+    with writer(path) as f:
+        n = scroll_collect(
+            driver,
+            timeline,
+            f,
+            existing,
+            scrolls=200,
+            patience=5,
+            extract=extract,
+            capture=capture,
+            limiter=limiter,
+        )
+
+    log.info(f'@{safe}: {n} new tweets -> {path}')
+    metrics.emit(f'@{safe}', new=n, elapsed=round(monotonic() - t0, 3))
+    return n
+
+
+def user_worker(cookies, queue, headless, delay, extract, capture, limiter, writer, profile=None):
+    """One browser session draining `queue` until it is empty."""
+    with browser(headless, capture, profile) as driver:
+        inject_cookies(driver, cookies)
+        gql = GraphqlCapture(driver, USER_OPS) if capture else None
+        while True:
+            try:
+                target = queue.get_nowait()
+            except Empty:
+                return
+            dump_user(driver, target, extract, gql, limiter, writer)
+            if not queue.empty():
+                w = delay + random.random() * delay  # noqa: S311
+                log.info(f'sleeping {w:.0f}s')
+                sleep(w)
+
+
 @main.command()
 @click.argument('username')
 @click.argument('targets', nargs=-1, required=True)
 @click.option('--headless/--no-headless', default=True)
 @click.option('-d', '--delay', type=float, default=30)
-def user(username, targets, headless, delay):
+@click.option('--extract', type=click.Choice(['js', 'xpath']), default='js')
+@click.option('--capture', is_flag=True, help='Read tweets from GraphQL responses, not the DOM.')
+@click.option('-w', '--workers', type=int, default=1, help='Parallel browser sessions.')
+@click.option('-r', '--rate', type=float, default=30, help='Page loads + scrolls/min, all workers.')
+@click.option('--profile', is_flag=True, help='Reuse the persistent Chrome profile from login.')
+@archive_options
+def user(username, targets, headless, delay, extract, capture, workers, rate, profile, writer):
     """Dump one or more user profiles."""
-    cookies = load_cookies(username)
+    cookies = load_cookies(username, required=not profile)
     os.makedirs(OUTDIR, exist_ok=True)
 
-    with browser(headless) as driver:
-        inject_cookies(driver, cookies)
+    queue = Queue()
+    names = dict.fromkeys(t.lstrip('@') for t in targets)  # @jack and jack share an archive
+    for t in names:
+        queue.put(t)
+    limiter = RateLimiter(rate)
+    n = max(1, min(workers, len(names)))
+    # copied before any Chrome starts writing to the original
+    profiles = [profile_path(username, i) if profile else None for i in range(n)]
+    with ThreadPoolExecutor(n, thread_name_prefix='tw-user') as pool:
+        futures = [
+            pool.submit(
+                user_worker,
+                cookies,
+                queue,
+                headless,
+                delay,
+                extract,
+                capture,
+                limiter,
+                writer,
+                profiles[i],
+            )
+            for i in range(n)
+        ]
+        for fut in futures:
+            fut.result()
 
-        for i, target in enumerate(targets):
-            safe = target.lstrip('@')
-            path = os.path.join(OUTDIR, f'user_{safe}.jl')
-            existing = seen_ids(path)
 
-            if existing:
-                log.info(f'@{safe}: {len(existing)} tweets on disk')
+def socket_path(username):
+    return os.path.join(SOCKET_DIR, f'tw-fetch_{username}.sock')
 
-            driver.get(f'https://x.com/{safe}')
-            sleep(3)
 
-            try:
-                timeline = wait_timeline(driver, 'Timeline')
-            except TimeoutException:
-                log.exception(f'@{safe}: no timeline found')
-                continue
+SESSION_LOST = ('chrome not reachable', 'disconnected', 'session deleted')
 
-            n = 0
-            stale = 0
-            with open(path, 'a') as f:
-                for _ in range(200):
-                    batch = 0
-                    for tag in get_tweets(timeline):
-                        r = parse_tweet(tag)
-                        if r and append(f, r, existing):
-                            batch += 1
-                            n += 1
-                            log.info(f'@{r["author"]}: {r["text"][:80]}')
-
-                    if batch == 0:
-                        stale += 1
-                        if stale >= 5:
-                            break
-                    else:
-                        stale = 0
-
-                    scroll_down(driver)
+
+def session_lost(e):
+    """True if the WebDriver error means the browser itself is gone."""
+    if isinstance(e, (InvalidSessionIdException, NoSuchWindowException)):
+        return True
+    return any(m in str(e).lower() for m in SESSION_LOST)
+
+
+class WarmBrowser:
+    """The browser `serve` keeps open, reopened when Chrome dies under it."""
+
+    def __init__(self, cookies, headless, capture, profile):
+        self.cookies = cookies
+        self.args = (headless, capture, profile)
+        self.stack = ExitStack()
+        self.driver = self.gql = None
+
+    def open(self):
+        self.driver = self.stack.enter_context(browser(*self.args))
+        inject_cookies(self.driver, self.cookies)
+        self.gql = GraphqlCapture(self.driver, USER_OPS) if self.args[1] else None
+
+    def restart(self):
+        with suppress(Exception):  # quit() on a dead session
+            self.stack.close()
+        self.open()
+
+    def dump(self, target, extract, limiter, writer):
+        """dump_user, retried once on a fresh browser if the session was lost."""
+        try:
+            return dump_user(self.driver, target, extract, self.gql, limiter, writer)
+        except WebDriverException as e:
+            if not session_lost(e):
+                raise
+            log.warning(f'@{target}: browser session lost, reopening')
+            self.restart()
+        # lost again: reported, and the next target reopens once more
+        return dump_user(self.driver, target, extract, self.gql, limiter, writer)
+
+
+@main.command()
+@click.argument('username')
+@click.option('--headless/--no-headless', default=True)
+@click.option('-d', '--delay', type=float, default=30)
+@click.option('--extract', type=click.Choice(['js', 'xpath']), default='js')
+@click.option('--capture', is_flag=True, help='Read tweets from GraphQL responses, not the DOM.')
+@click.option('-r', '--rate', type=float, default=30, help='Page loads + scrolls/min.')
+@click.option('--profile', is_flag=True, help='Reuse the persistent Chrome profile from login.')
+@click.option('--socket', 'sock', type=click.Path(), default=None, help='Unix socket to listen on.')
+@archive_options
+def serve(username, headless, delay, extract, capture, rate, profile, sock, writer):
+    """Keep one warm browser and dump targets sent by `submit`.
+
+    Each connection sends targets one per line; the reply is one JSON line
+    per target with its new tweet count. Targets are handled in order; if
+    Chrome dies the browser is reopened and the target retried once.
+    """
+    cookies = load_cookies(username, required=not profile)
+    os.makedirs(OUTDIR, exist_ok=True)
+    sock = sock or socket_path(username)
+    os.makedirs(os.path.dirname(sock) or '.', exist_ok=True)
+    with suppress(FileNotFoundError):
+        os.remove(sock)
+    limiter = RateLimiter(rate)
+
+    warm = WarmBrowser(cookies, headless, capture, profile_path(username) if profile else None)
+    with warm.stack, socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as srv:
+        warm.open()
+        srv.bind(sock)
+        srv.listen()
+        log.info(f'listening on {sock}')
+        while True:
+            conn, _ = srv.accept()
+            with conn, conn.makefile('rwb') as io:
+                targets = [t for t in (line.decode().strip() for line in io) if t]
+                for i, target in enumerate(targets):
                     try:
-                        timeline = wait_timeline(driver, 'Timeline')
-                    except TimeoutException:
-                        break
+                        res = {'target': target, 'new': warm.dump(target, extract, limiter, writer)}
+                    except Exception as e:  # archive, seen db, ...: keep the browser warm
+                        log.exception(f'@{target}: failed')
+                        res = {'target': target, 'error': str(e).strip() or repr(e)}
+                    with suppress(OSError):
+                        io.write(json.dumps(res).encode() + b'\n')
+                        io.flush()
+                    if i < len(targets) - 1:
+                        sleep(delay + random.random() * delay)  # noqa: S311
 
-            log.info(f'@{safe}: {n} new tweets -> {path}')
 
-            if i < len(targets) - 1:
-                w = delay + random.random() * delay  # noqa: S311
-                log.info(f'sleeping {w:.0f}s')
-                sleep(w)
+@main.command()
+@click.argument('username')
+@click.argument('targets', nargs=-1, required=True)
+@click.option('--socket', 'sock', type=click.Path(), default=None, help='Socket of `serve`.')
+def submit(username, targets, sock):
+    """Send targets to a running `serve` and print its per-target results."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(sock or socket_path(username))
+        s.sendall(''.join(f'{t}\n' for t in targets).encode())
+        s.shutdown(socket.SHUT_WR)
+        with s.makefile('rb') as f:
+            for line in f:
+                print(line.decode(), end='')
+
+
+@main.command()
+@click.argument('snapshots', type=click.Path(exists=True))
+@click.option(
+    '-m',
+    '--mode',
+    'modes',
+    multiple=True,
+    type=click.Choice(['text', 'python', 'graphql', 'js', 'xpath']),
+    help='Pipelines to run (default: all that the snapshots support).',
+)
+@click.option('--headless/--no-headless', default=True)
+def bench(snapshots, modes, headless):
+    """Replay snapshots saved with --record and report throughput.
+
+    text times html -> text normalization alone; python and graphql replay
+    the recorded fields/payloads through parse, dedupe and append; js and
+    xpath load each snapshot as a static page in headless Chrome and run
+    the live extraction path. No network needed.
+    """
+    snaps = load_snapshots(snapshots)
+    if not modes:
+        modes = ['text', 'python', 'js', 'xpath']
+        if any(s['graphql'] for s in snaps):
+            modes.insert(2, 'graphql')
+    if len(modes) == 1:
+        print(json.dumps(bench_mode(snaps, modes[0], headless)))
+        return
+    # one process per mode, so each reports its own peak RSS
+    opts = ['--shared-seen'] if SeenStore.path else []
+    opts += ['--metrics', metrics.jsonl] if metrics.jsonl else []
+    opts += ['--prom', metrics.prom] if metrics.prom else []
+    head = '--headless' if headless else '--no-headless'
+    for mode in modes:
+        argv = [sys.executable, os.path.abspath(__file__), *opts, 'bench', snapshots, '-m', mode]
+        out = subprocess.run([*argv, head], stdout=subprocess.PIPE, text=True, check=False)  # noqa: S603
+        if out.returncode:
+            raise click.ClickException(f'bench -m {mode} exited with {out.returncode}')
+        click.echo(out.stdout, nl=False)
+
+
+def bench_mode(snaps, mode, headless):
+    with TemporaryDirectory() as tmp, peak_rss_mb() as peak:
+        path = os.path.join(tmp, 'bench.jl')
+        if SeenStore.path:
+            existing = SeenStore(path, os.path.join(tmp, SEEN_DB))
+        else:
+            existing = seen_ids(path)
+        metrics.reset()
+        t0 = perf_counter()
+        with JsonlWriter(path, 'round') as w:
+            if mode == 'text':
+                n = replay_text(snaps)
+            elif mode == 'python':
+                n = replay_python(snaps, existing, w)
+            elif mode == 'graphql':
+                n = replay_graphql(snaps, existing, w)
+            else:
+                n = replay_browser(snaps, existing, w, mode, headless)
+        secs = perf_counter() - t0
+        calls = metrics.emit(f'bench:{mode}')['events'].get('webdriver_calls', 0)
+    return {
+        'mode': mode,
+        'snapshots': len(snaps),
+        'tweets': n,
+        'seconds': round(secs, 3),
+        'tweets_per_s': round(n / secs, 1) if secs else None,
+        'webdriver_calls_per_tweet': round(calls / n, 2) if n else None,
+        'peak_rss_mb': peak,
+    }
+
+
+@main.command()
+@click.argument('files', nargs=-1, required=True, type=click.Path(exists=True))
+def decode(files):
+    """Decode saved GraphQL timeline responses to JSONL on stdout."""
+    for p in files:
+        with open(p) as f:
+            for r in decode_timeline(json.load(f)):
+                print(json.dumps(r))
+
+
+@main.command('cat')
+@click.argument('archive', type=click.Path())
+def cat_(archive):
+    """Print an archive (plain or segmented) as JSONL on stdout."""
+    for line in iter_lines(archive):
+        sys.stdout.buffer.write(line)
 
 
 def save_cookies(username, cookies):
@@ -342,13 +1752,15 @@ def save_cookies(username, cookies):
 
 @main.command()
 @click.argument('username')
-def login(username):
+@click.option('--profile', is_flag=True, help='Log in inside the persistent Chrome profile.')
+def login(username, profile):
     """Open browser, log in manually, cookies are saved on close.
 
     Opens x.com in a visible browser. Log in by hand, then press
-    Enter in this terminal. Cookies are saved for later headless runs.
+    Enter in this terminal. Cookies are saved for later headless runs;
+    with --profile the Chrome profile itself also stays logged in.
     """
-    with browser(headless=False) as driver:
+    with browser(headless=False, profile=profile_path(username) if profile else None) as driver:
         driver.get('https://x.com/i/flow/login')
         input("press Enter after you've logged in...")
         cookies = driver.get_cookies()
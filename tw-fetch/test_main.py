@@ -0,0 +1,574 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import main
+from click.testing import CliRunner
+
+TESTDATA = os.path.join(os.path.dirname(__file__), 'testdata')
+
+
+def write_archive(path, ids):
+    with open(path, 'a') as f:
+        f.writelines(json.dumps({'id': i, 'text': f't{i}'}) + '\n' for i in ids)
+
+
+def test_index_builds_from_archive(tmp_path):
+    path = tmp_path / 'timeline_x.jl'
+    write_archive(path, [5, 3, 9])
+
+    idx = main.seen_ids(str(path))
+
+    assert len(idx) == 3
+    assert 3 in idx
+    assert 4 not in idx
+    assert (tmp_path / 'timeline_x.jl.idx').exists()
+
+
+def test_index_reloads_synced_ids(tmp_path):
+    path = tmp_path / 'timeline_x.jl'
+    write_archive(path, [1, 2])
+    idx = main.seen_ids(str(path))
+    write_archive(path, [7])
+    idx.add(7)
+    idx.sync()
+
+    again = main.IdIndex(str(path))
+
+    assert sorted(again.base) + sorted(again.tail) == [1, 2, 7]
+    assert again.covered == path.stat().st_size
+
+
+def test_index_catches_up_unsynced_records(tmp_path):
+    # Records written after the last sync (crash) are picked up from the
+    # covered offset without a full rebuild.
+    path = tmp_path / 'timeline_x.jl'
+    write_archive(path, [1])
+    main.seen_ids(str(path))
+    write_archive(path, [2, 3])
+
+    idx = main.seen_ids(str(path))
+
+    assert 2 in idx
+    assert 3 in idx
+    assert idx.covered == path.stat().st_size
+
+
+def test_index_rebuilds_when_archive_shrinks(tmp_path):
+    path = tmp_path / 'timeline_x.jl'
+    write_archive(path, [1, 2, 3])
+    main.seen_ids(str(path))
+    path.write_text(json.dumps({'id': 8}) + '\n')
+
+    idx = main.seen_ids(str(path))
+
+    assert len(idx) == 1
+    assert 8 in idx
+    assert 1 not in idx
+
+
+def test_index_compacts_large_tail(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'IDX_COMPACT', 2)
+    path = tmp_path / 'timeline_x.jl'
+    idx = main.seen_ids(str(path))
+    ids = [30, 10, 20]
+    write_archive(path, ids)
+    for i in ids:
+        idx.add(i)
+    idx.sync()
+
+    assert list(idx.base) == [10, 20, 30]
+    assert not idx.tail
+
+
+def test_make_record_normalizes_text():
+    r = main.make_record(
+        'https://x.com/jack/status/20',
+        '@jack',
+        '<span>just setting\nup</span>  <a href="#">my&amp;twttr</a>',
+        '2006-03-21T20:50:14.000Z',
+    )
+
+    assert r == {
+        'id': 20,
+        'url': 'https://x.com/jack/status/20',
+        'author': '@jack',
+        'text': 'just setting up my&twttr',
+        'ctime': 1142974214.0,
+    }
+
+
+def test_make_record_rejects_non_status_link():
+    assert main.make_record('https://x.com/jack', '@jack', 'x', '2006-03-21T20:50:14.000Z') is None
+
+
+def load_fixture(name):
+    with open(os.path.join(TESTDATA, name)) as f:
+        return json.load(f)
+
+
+def test_decode_timeline_fixture():
+    records = main.decode_timeline(load_fixture('user_tweets.json'))
+
+    assert [r['id'] for r in records] == [20, 31, 13, 50, 70, 60]
+    first = records[0]
+    assert first['author'] == '@jack'
+    assert first['url'] == 'https://x.com/jack/status/20'
+    assert first['text'] == 'just setting up my twttr & co'
+    assert first['ctime'] == 1142974214.0
+
+
+def test_decode_timeline_extra_fields():
+    by_id = {r['id']: r for r in main.decode_timeline(load_fixture('user_tweets.json'))}
+
+    assert by_id[31]['reply_to'] == 20
+    assert by_id[31]['quote_of'] == 12
+    assert by_id[31]['media'] == ['https://pbs.twimg.com/media/a.jpg']
+    assert by_id[13]['retweeted_by'] == '@jack'
+    assert by_id[70]['promoted'] is True
+    assert by_id[60]['text'] == 'the full long text'
+    assert 12 not in by_id  # quoted tweets are referenced, not archived
+
+
+def test_rate_limiter_spaces_calls(monkeypatch):
+    clock = [100.0]
+    slept = []
+    monkeypatch.setattr(main, 'monotonic', lambda: clock[0])
+    monkeypatch.setattr(main, 'sleep', slept.append)
+    limiter = main.RateLimiter(per_min=30)
+
+    for _ in range(3):
+        limiter.wait()
+
+    assert slept == [0.0, 2.0, 4.0]
+
+
+def test_pacer_follows_tweet_rate(monkeypatch):
+    monkeypatch.setattr(main.random, 'random', lambda: 0.0)
+    pacer = main.Pacer(floor=30, ceil=600, target=50)
+
+    # 300 new tweets over 60s round + 120s pause -> well above target: floor
+    assert pacer.next(300, 60) == 30
+    # quiet rounds drag the smoothed rate down, so the pause grows
+    quiet = [pacer.next(0, 60) for _ in range(4)]
+    assert quiet == sorted(quiet)
+    assert quiet[-1] > 30
+
+
+def test_pacer_doubles_on_empty_start_and_caps(monkeypatch):
+    monkeypatch.setattr(main.random, 'random', lambda: 0.0)
+    pacer = main.Pacer(floor=30, ceil=600, target=50)
+
+    assert [pacer.next(0, 10) for _ in range(4)] == [240, 480, 600, 600]
+
+
+class FakeElem:
+    def __init__(self, id_, link=None):
+        self.id = id_
+        self.link = link or f'https://x.com/a/status/{id_}'
+
+
+def xpath_fakes(monkeypatch):
+    parsed = []
+    monkeypatch.setattr(main, 'get_tweets', lambda timeline: timeline)
+    monkeypatch.setattr(main, 'tweet_link', lambda e: e.link)
+    monkeypatch.setattr(main, 'parse_tweet', lambda e: parsed.append(e.link) or {'id': e.id})
+    return parsed
+
+
+def test_xpath_pass_parses_only_new_elements(monkeypatch):
+    parsed = xpath_fakes(monkeypatch)
+    handled = set()
+
+    main.new_tweets(None, [FakeElem('a'), FakeElem('b')], set(), 'xpath', handled=handled)
+    main.new_tweets(None, [FakeElem(i) for i in 'bcd'], set(), 'xpath', handled=handled)
+
+    assert [link[-1] for link in parsed] == ['a', 'b', 'c', 'd']
+
+
+def test_xpath_pass_reparses_recycled_element(monkeypatch):
+    parsed = xpath_fakes(monkeypatch)
+    handled = set()
+
+    main.new_tweets(
+        None, [FakeElem('a', 'https://x.com/a/status/1')], set(), 'xpath', handled=handled
+    )
+    main.new_tweets(
+        None, [FakeElem('a', 'https://x.com/a/status/2')], set(), 'xpath', handled=handled
+    )
+
+    assert parsed == ['https://x.com/a/status/1', 'https://x.com/a/status/2']
+
+
+def test_repair_tail_truncates_torn_line(tmp_path):
+    path = tmp_path / 'user_x.jl'
+    path.write_bytes(b'{"id": 1}\n{"id": 2}\n{"id": 3, "te')
+
+    main.repair_tail(str(path))
+
+    assert path.read_bytes() == b'{"id": 1}\n{"id": 2}\n'
+
+
+def test_repair_tail_keeps_whole_file(tmp_path):
+    path = tmp_path / 'user_x.jl'
+    path.write_bytes(b'{"id": 1}\n')
+
+    main.repair_tail(str(path))
+
+    assert path.read_bytes() == b'{"id": 1}\n'
+
+
+def test_writer_buffers_until_flush(tmp_path):
+    path = tmp_path / 'user_x.jl'
+    with main.JsonlWriter(str(path), 'batch', flush_ms=60_000) as w:
+        w.write({'id': 1})
+        w.write({'id': 2})
+        assert path.read_text() == ''
+        w.flush()
+        assert path.read_text() == '{"id": 1}\n{"id": 2}\n'
+        w.write({'id': 3})
+
+    assert path.read_text().splitlines()[-1] == '{"id": 3}'
+
+
+def test_writer_record_durability_writes_through(tmp_path):
+    path = tmp_path / 'user_x.jl'
+    with main.JsonlWriter(str(path), 'record') as w:
+        w.write({'id': 1})
+        assert path.read_text() == '{"id": 1}\n'
+
+
+def test_rotation_seals_and_reads_back(tmp_path):
+    path = str(tmp_path / 'timeline_x.jl')
+    write_archive(path, [1, 2])  # pre-rotation archive becomes segment 0
+
+    with main.JsonlWriter(path, rotate='size', segment_mb=0) as w:
+        w.write({'id': 3})
+        w.flush()
+        w.write({'id': 4})
+
+    manifest = main.load_manifest(path)
+    names = [s['name'] for s in manifest['segments']]
+    assert names[:2] == ['timeline_x.000000.jl.zst', 'timeline_x.000001.jl.zst']
+    assert manifest['segments'][0]['records'] == 3
+    assert not (tmp_path / 'timeline_x.jl').exists()
+    assert [r['id'] for r in main.iter_records(path)] == [1, 2, 3, 4]
+
+
+def test_index_resumes_across_segments(tmp_path):
+    path = str(tmp_path / 'timeline_x.jl')
+    with main.JsonlWriter(path, rotate='size', segment_mb=0) as w:
+        for i in (5, 6, 7):
+            w.write({'id': i})
+            w.flush()
+
+    idx = main.seen_ids(path)
+
+    assert len(idx) == 3
+    assert 6 in idx
+    assert idx.covered == main.archive_size(path)
+    # a later writer without --rotate keeps appending to segments
+    with main.JsonlWriter(path) as w:
+        w.write({'id': 8})
+    assert [r['id'] for r in main.iter_records(path)] == [5, 6, 7, 8]
+    assert 8 in main.seen_ids(path)
+
+
+class FakeDriver:
+    def __init__(self):
+        self.commands = []
+
+    def execute(self, command, params=None):
+        self.commands.append((command, params))
+        return {'value': None}
+
+
+def test_metrics_counts_webdriver_calls_and_emits(tmp_path):
+    m = main.Metrics()
+    m.jsonl = str(tmp_path / 'metrics.jl')
+    m.prom = str(tmp_path / 'tw.prom')
+    driver = FakeDriver()
+    m.instrument(driver)
+
+    with m.phase('get_tweets'):
+        driver.execute('executeScript')
+        driver.execute('executeScript')
+    m.count('tweets', 4)
+    rec = m.emit('@jack', new=4)
+
+    assert rec['events'] == {'webdriver_calls': 2, 'tweets': 4}
+    assert len(driver.commands) == 2
+    assert set(rec['phases']) == {'get_tweets'}
+    assert json.loads((tmp_path / 'metrics.jl').read_text())['unit'] == '@jack'
+    prom = (tmp_path / 'tw.prom').read_text()
+    assert 'tw_fetch_events_total{event="webdriver_calls"} 2' in prom
+    assert m.emit('@jack')['events'] == {}
+
+
+def test_bench_python_replay(tmp_path):
+    tweet = {
+        'url': 'https://x.com/jack/status/20',
+        'author': '@jack',
+        'html': 'just setting up',
+        'published': '2006-03-21T20:50:14.000Z',
+        'outer': '<article></article>',
+    }
+    snap = {'ts': 0, 'url': 'https://x.com/jack', 'tweets': [tweet], 'graphql': []}
+    path = tmp_path / 'snaps.jl'
+    path.write_text((json.dumps(snap) + '\n') * 2)  # second pass repeats the tweet
+
+    result = CliRunner().invoke(main.main, ['bench', str(path), '-m', 'python'])
+
+    assert result.exit_code == 0, result.output
+    report = json.loads(result.output)
+    assert report['mode'] == 'python'
+    assert report['snapshots'] == 2
+    assert report['tweets'] == 1
+    assert report['peak_rss_mb']['tree'] >= report['peak_rss_mb']['self'] > 0
+
+    result = CliRunner().invoke(main.main, ['bench', str(path), '-m', 'text', '-m', 'python'])
+
+    assert result.exit_code == 0, result.output
+    reports = [json.loads(line) for line in result.output.splitlines()]
+    assert [r['mode'] for r in reports] == ['text', 'python']
+
+
+def test_tree_rss_counts_grandchildren():
+    before = main.tree_rss_mb(os.getpid())
+    code = 'import subprocess, sys; subprocess.run([sys.executable, "-c", sys.argv[1]])'
+    hog = 'b = bytearray(64 << 20); b[::4096] = b"x" * (16 << 10); input()'
+    child = subprocess.Popen([sys.executable, '-c', code, hog], stdin=subprocess.PIPE)  # noqa: S603
+    try:
+        deadline = time.monotonic() + 10
+        while main.tree_rss_mb(os.getpid()) - before < 50 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert main.tree_rss_mb(os.getpid()) - before >= 50
+    finally:
+        child.communicate(b'\n')
+
+
+def test_normalize_matches_golden_corpus():
+    # Generated with the original per-call HTMLParser + re.sub implementation.
+    with open(os.path.join(TESTDATA, 'strip_golden.jsonl')) as f:
+        cases = [json.loads(line) for line in f]
+
+    for case in cases * 2:  # second pass runs on the reused parser
+        assert main.squash(main.strip_tags(case['html'])) == case['text'], case['html']
+
+
+def test_shared_seen_dedupes_across_archives(tmp_path):
+    db = str(tmp_path / 'seen.db')
+    home = str(tmp_path / 'timeline_x.jl')
+    jack = str(tmp_path / 'user_jack.jl')
+    write_archive(home, [1, 2])
+
+    a = main.SeenStore(home, db)
+    b = main.SeenStore(jack, db)
+
+    assert len(a) == 2
+    assert 2 in b  # indexed from the home archive on open
+    assert a.claim(3)
+    a.sync()
+    assert not b.claim(3)
+    assert b.claim(4)
+    b.sync()
+    assert 4 in a
+    assert len(b) == 1
+
+
+def test_shared_seen_concurrent_claim_waits_for_commit(tmp_path):
+    db = str(tmp_path / 'seen.db')
+    a = main.SeenStore(str(tmp_path / 'timeline_x.jl'), db)
+    results = []
+
+    def other():
+        results.append(main.SeenStore(str(tmp_path / 'user_jack.jl'), db).claim(3))
+
+    assert a.claim(3)
+    t = threading.Thread(target=other)
+    t.start()
+    t.join(0.2)
+    assert t.is_alive()  # blocked on a's open claim transaction
+    a.sync()
+    t.join()
+
+    assert results == [False]
+
+
+def test_shared_seen_rolls_back_unsynced_claims(tmp_path):
+    db = str(tmp_path / 'seen.db')
+    path = str(tmp_path / 'user_jack.jl')
+    s = main.SeenStore(path, db)
+    s.claim(7)
+    s.close()  # crash before the archive was flushed
+
+    assert 7 not in main.SeenStore(path, db)
+
+
+def test_shared_seen_catches_up_records_written_after_sync(tmp_path):
+    db = str(tmp_path / 'seen.db')
+    path = str(tmp_path / 'user_jack.jl')
+    with main.JsonlWriter(path) as w:
+        s = main.SeenStore(path, db)
+        main.append(w, {'id': 5}, s)
+        w.flush()
+        s.sync()
+        main.append(w, {'id': 6}, s)
+    s.close()  # 6 reached the archive but its claim was never committed
+
+    again = main.SeenStore(path, db)
+
+    assert 6 in again
+    assert len(again) == 2
+    assert again.covered == main.archive_size(path)
+
+
+class CookieDriver:
+    def __init__(self, logged_in):
+        self.cookies = {'auth_token': {'name': 'auth_token'}} if logged_in else {}
+        self.added = []
+
+    def get(self, url):
+        pass
+
+    def get_cookie(self, name):
+        return self.cookies.get(name)
+
+    def add_cookie(self, c):
+        self.added.append(c)
+
+
+def test_inject_cookies_skips_logged_in_profile():
+    cookies = [{'name': 'auth_token', 'value': 'x'}]
+    warm, cold = CookieDriver(logged_in=True), CookieDriver(logged_in=False)
+
+    main.inject_cookies(warm, cookies)
+    main.inject_cookies(cold, cookies)
+
+    assert warm.added == []
+    assert cold.added == cookies
+
+
+def test_profile_copies_for_extra_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'PROFILE_DIR', str(tmp_path))
+    base = tmp_path / 'me'
+    (base / 'Default').mkdir(parents=True)
+    (base / 'Default' / 'Cookies').write_text('session')
+    (base / 'SingletonLock').write_text('host-123')
+
+    assert main.profile_path('me') == str(base)
+    copy = tmp_path / 'me-1'
+    assert main.profile_path('me', 1) == str(copy)
+    assert (copy / 'Default' / 'Cookies').read_text() == 'session'
+    assert not (copy / 'SingletonLock').exists()
+
+
+def start_serve(args):
+    threading.Thread(
+        target=main.serve.main, args=(args,), kwargs={'standalone_mode': False}, daemon=True
+    ).start()
+    for _ in range(100):
+        if os.path.exists(args[-1]):
+            break
+        time.sleep(0.01)
+
+
+def test_serve_submit_round_trip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sock = str(tmp_path / 's.sock')
+    done = []
+
+    @contextmanager
+    def browser(headless, capture, profile):
+        assert (headless, capture, profile) == (True, False, main.profile_path('me'))
+        yield CookieDriver(logged_in=True)
+
+    def dump_user(driver, target, *_args):
+        assert isinstance(driver, CookieDriver)
+        if target == 'full':
+            raise OSError(28, 'No space left on device')
+        done.append(target)
+        return len(target)
+
+    monkeypatch.setattr(main, 'browser', browser)
+    monkeypatch.setattr(main, 'dump_user', dump_user)
+    start_serve(['me', '--profile', '-d', '0', '--socket', sock])
+
+    submit = ['submit', 'me', 'jack', 'full', 'ev', '--socket', sock]
+    res = CliRunner().invoke(main.main, submit)
+
+    assert res.exit_code == 0, res.output
+    lines = [json.loads(line) for line in res.output.splitlines()]
+    assert lines == [
+        {'target': 'jack', 'new': 4},
+        {'target': 'full', 'error': '[Errno 28] No space left on device'},
+        {'target': 'ev', 'new': 2},
+    ]
+    assert done == ['jack', 'ev']
+
+
+def test_serve_reopens_lost_browser(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sock = str(tmp_path / 's.sock')
+    drivers, done = [], []
+
+    @contextmanager
+    def browser(*_args):
+        drivers.append(CookieDriver(logged_in=True))
+        yield drivers[-1]
+
+    def dump_user(driver, target, *_args):
+        if target == 'crash' and driver is drivers[0]:
+            raise main.WebDriverException('chrome not reachable')
+        if target == 'gone':
+            raise main.InvalidSessionIdException('invalid session id')
+        done.append((target, drivers.index(driver)))
+        return 1
+
+    monkeypatch.setattr(main, 'browser', browser)
+    monkeypatch.setattr(main, 'dump_user', dump_user)
+    start_serve(['me', '--profile', '-d', '0', '--socket', sock])
+
+    res = CliRunner().invoke(main.main, ['submit', 'me', 'crash', 'gone', 'ev', '--socket', sock])
+
+    assert res.exit_code == 0, res.output
+    lines = [json.loads(line) for line in res.output.splitlines()]
+    assert lines[0] == {'target': 'crash', 'new': 1}  # retried on a fresh driver
+    assert lines[1]['target'] == 'gone'
+    assert 'invalid session id' in lines[1]['error']
+    assert lines[2] == {'target': 'ev', 'new': 1}
+    assert done == [('crash', 1), ('ev', 2)]
+
+
+def test_user_dedupes_targets_by_archive(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, 'profile_path', lambda *_args: None)
+    drained = []
+
+    def user_worker(_cookies, queue, *_args):
+        while not queue.empty():
+            drained.append(queue.get_nowait())
+
+    monkeypatch.setattr(main, 'user_worker', user_worker)
+
+    res = CliRunner().invoke(
+        main.main, ['user', 'me', 'jack', '@jack', 'ev', '--profile', '-w', '4']
+    )
+
+    assert res.exit_code == 0, res.output
+    assert sorted(drained) == ['ev', 'jack']
+
+
+def test_shared_seen_rejects_round_durability(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.SeenStore, 'path', None)  # restored after the CLI sets it
+
+    args = ['--shared-seen', 'user', 'me', 'jack', '--durability', 'round']
+    res = CliRunner().invoke(main.main, args)
+
+    assert res.exit_code == 2
+    assert '--shared-seen needs --durability batch or record' in res.output